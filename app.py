@@ -1,58 +1,219 @@
 import os
+from importlib import import_module
+from datetime import timedelta
+import click
 from flask import Flask
-from flask_migrate import Migrate
-from model import db
+from flask.cli import AppGroup
 from flask_jwt_extended import JWTManager
-from datetime import timedelta
 from flask_cors import CORS
-import africastalking
-from flask_bcrypt import Bcrypt  # Import Bcrypt
-
-# Initialize Flask app
-app = Flask(__name__)
-
-# Initialize Bcrypt
-bcrypt = Bcrypt(app)
-
-# Database configuration (SQLite instead of PostgreSQL)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///app.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Disable SQLAlchemy track modifications
-
-# JWT configuration
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "default-secret-key")
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=2)
-jwt = JWTManager(app)
-
-# Initialize db and migrate
-db.init_app(app)
-migrate = Migrate(app, db)
-
-# Enable CORS globally
-CORS(app)
-
-# Africa's Talking configuration
-africastalking.initialize(
-    username=os.getenv("blessing"),
-    api_key=os.getenv("atsk_89ef57f9358c238ea8e31ac2a5695096abd2bd649ae96f7f2f7813c0f2219aac1b67529c")
-)
-
-# Register blueprints (make sure the import paths are correct)
-from views.filtering_sorting import filtering_sorting_bp  # Correct import
-from views.africastalking_setup import africastalking_setup_bp  # Correct import
-from views.Auth import auth_bp
-from views.payment import payment_bp
-from views.product import product_bp
-from views.search import search_bp
-from views.user import user_bp
-
-# Register blueprints with the app
-app.register_blueprint(auth_bp)
-app.register_blueprint(filtering_sorting_bp)  # Registering the blueprint
-app.register_blueprint(payment_bp)
-app.register_blueprint(product_bp)
-app.register_blueprint(search_bp)
-app.register_blueprint(user_bp)
-app.register_blueprint(africastalking_setup_bp)  # Registering the blueprint
+from services.db_profiles import init_database
+from services.db_routing import init_replicas, replica_binds
+from services.instrumentation import instrumentation
+
+# Blueprints by name: (module, attribute). Modules are imported only when selected,
+# so a worker that serves a few endpoints doesn't load every view and its dependencies.
+BLUEPRINTS = {
+    'auth': ('views.Auth', 'auth_bp'),
+    'filtering_sorting': ('views.filtering_sorting', 'filter_bp'),
+    'history': ('views.search', 'history_bp'),
+    'metrics': ('views.metrics', 'metrics_bp'),
+    'payment': ('views.payment', 'payment_bp'),
+    'price_alerts': ('views.price_alerts', 'price_alerts_bp'),
+    'price_history': ('views.price_history', 'price_history_bp'),
+    'product': ('views.product', 'product_bp'),
+    'user': ('views.user', 'user_bp'),
+}
+
+
+def default_config():
+    return {
+        # Database configuration (SQLite by default; engine tuning follows DB_PROFILE or the URL)
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DATABASE_URL', 'sqlite:///app.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,  # Disable SQLAlchemy track modifications
+
+        # Comma-separated read replica URLs; @read_only endpoints read from them
+        'SQLALCHEMY_BINDS': replica_binds(os.getenv('DATABASE_REPLICA_URLS')),
+
+        # JWT configuration
+        'JWT_SECRET_KEY': os.getenv("JWT_SECRET_KEY", "default-secret-key"),
+        'JWT_ACCESS_TOKEN_EXPIRES': timedelta(hours=2),
+
+        # Africa's Talking credentials; the SDK is initialized on the first SMS sent
+        'AFRICASTALKING_USERNAME': os.getenv("AFRICASTALKING_USERNAME"),
+        'AFRICASTALKING_API_KEY': os.getenv("AFRICASTALKING_API_KEY"),
+
+        # Shared secret (X-Ops-Token header) for the endpoints that reset or reconfigure metrics
+        'METRICS_ADMIN_TOKEN': os.getenv("METRICS_ADMIN_TOKEN"),
+
+        # Comma-separated blueprint names to serve (default: all of BLUEPRINTS)
+        'BLUEPRINTS': os.getenv("APP_BLUEPRINTS"),
+
+        # Drain the SMS outbox from a thread in each serving process; set SMS_DISPATCHER=0
+        # where a separate `flask sms-dispatch` worker sends the messages instead
+        'SMS_DISPATCHER': os.getenv("SMS_DISPATCHER", "1") != "0",
+
+        # Flask-Migrate pulls in Alembic; web workers can set DB_MIGRATIONS=0 to skip it
+        'DB_MIGRATIONS': os.getenv("DB_MIGRATIONS", "1") != "0",
+    }
+
+
+def register_blueprints(app, names):
+    for name in names:
+        if name not in BLUEPRINTS:
+            raise ValueError(f"Unknown blueprint {name!r}; choose from {', '.join(sorted(BLUEPRINTS))}")
+        module, attribute = BLUEPRINTS[name]
+        app.register_blueprint(getattr(import_module(module), attribute))
+
+
+def register_commands(app):
+    @app.cli.command('compact-rankings')
+    def compact_rankings_command():
+        """Delete superseded and expired product rankings."""
+        from services.ranking import compact_rankings
+        removed = compact_rankings()
+        print(f"Removed {removed} ranked product rows")
+
+    @app.cli.command('prune-search-history')
+    def prune_search_history_command():
+        """Delete search history older than the retention period."""
+        from services.search_history import prune_search_history
+        removed = prune_search_history()
+        print(f"Removed {removed} search history rows")
+
+    @app.cli.command('cluster-products')
+    def cluster_products_command():
+        """Regroup every product into cross-shop clusters from scratch."""
+        from services.clustering import rebuild_clusters
+        clusters = rebuild_clusters()
+        print(f"Grouped products into {clusters} clusters")
+
+    @app.cli.command('sync-sqlite-replicas')
+    def sync_sqlite_replicas_command():
+        """Copy a SQLite primary into the SQLite replicas (local testing of read routing)."""
+        from services.db_routing import sync_sqlite_replicas
+        copied = sync_sqlite_replicas(app)
+        print(f"Copied the primary into {', '.join(copied) or 'no replicas'}")
+
+    @app.cli.command('sms-dispatch')
+    @click.option('--once', is_flag=True, help="Send what is due now and exit.")
+    def sms_dispatch_command(once):
+        """Send queued SMS (password resets, price alerts) until interrupted."""
+        from services.sms_outbox import sms_dispatcher
+        if once:
+            sent = 0
+            while True:
+                processed = sms_dispatcher.dispatch_once()
+                if not processed:
+                    break
+                sent += processed
+            print(f"Processed {sent} queued messages")
+            return
+        try:
+            sms_dispatcher.run(app)
+        except KeyboardInterrupt:
+            pass
+
+    catalog = AppGroup('catalog', help="Bulk import and export of the product catalog.")
+
+    @catalog.command('import')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help="Default: from the file extension.")
+    @click.option('--chunk-size', type=int, help="Records per transaction.")
+    @click.option('--workers', type=int, help="Validation processes; 0 validates in-process. Default: CPUs - 1.")
+    @click.option('--checkpoint', type=click.Path(dir_okay=False), help="Default: PATH.checkpoint")
+    @click.option('--restart', is_flag=True, help="Ignore an existing checkpoint and start from the top.")
+    @click.option('--rejects', type=click.Path(dir_okay=False), help="Write rejected records here as NDJSON.")
+    @click.option('--cluster', is_flag=True, help="Assign clusters while importing (slower than cluster-products afterwards).")
+    def catalog_import_command(path, fmt, chunk_size, workers, checkpoint, restart, rejects, cluster):
+        """Stream a CSV or NDJSON shop feed into the catalog, resuming from its checkpoint."""
+        from services.catalog import CatalogError, import_catalog
+
+        def progress(state):
+            print(f"{state['records']:>12,} records  {state['imported']:>12,} imported  "
+                  f"{state['rejected']:>8,} rejected  {state['records'] / state['elapsed']:>9,.0f} records/s")
+
+        try:
+            stats = import_catalog(path, fmt, chunk_size, workers, checkpoint, restart, rejects, cluster, progress)
+        except CatalogError as exc:
+            raise click.ClickException(str(exc))
+        if stats['resumed_at']:
+            print(f"Resumed after record {stats['resumed_at']:,}")
+        for error in stats['errors']:
+            print(f"record {error['record']}: {error['error']}")
+        print(f"Imported {stats['imported']:,} of {stats['records']:,} records "
+              f"({stats['rejected']:,} rejected) in {stats['elapsed']:.1f}s")
+
+    @catalog.command('export')
+    @click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help="Default: from the file extension.")
+    @click.option('--shop', help="Only this shop's listings.")
+    def catalog_export_command(path, fmt, shop):
+        """Stream the catalog to PATH (or - for stdout) in the import format."""
+        from services.catalog import CatalogError, detect_format, export_catalog
+        try:
+            fmt = detect_format(path, fmt or ('ndjson' if path == '-' else None))
+        except CatalogError as exc:
+            raise click.ClickException(str(exc))
+        with click.open_file(path, 'w', encoding='utf-8', lazy=False) as out:
+            written = export_catalog(out, fmt, shop)
+        if path != '-':
+            print(f"Exported {written:,} products to {path}")
+
+    app.cli.add_command(catalog)
+
+
+def create_app(config=None, blueprints=None):
+    """
+    Build the Flask app.
+
+    `config` overrides the defaults above. `blueprints` (or the BLUEPRINTS config
+    value) selects which endpoint groups to serve; everything is served by default.
+    Used by `flask run` (which finds this factory) and WSGI servers via "app:create_app()".
+    """
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+
+    jwt = JWTManager(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        # Answered from the in-memory revocation index, not the database
+        from services.auth_cache import revocation_index
+        return revocation_index.is_revoked(jwt_payload.get('jti'))
+
+    # Initialize db (with the SQLite or PostgreSQL engine profile), replica routing and migrate
+    init_database(app)
+    init_replicas(app)
+    if app.config['DB_MIGRATIONS']:
+        from flask_migrate import Migrate
+        from model import db
+        Migrate(app, db)
+
+    # Start the SMS dispatcher with the first request rather than here, so it runs in each
+    # serving process (also after a pre-fork) and sends messages left from before a restart
+    if app.config['SMS_DISPATCHER']:
+        from services.sms_outbox import sms_dispatcher
+
+        @app.before_request
+        def start_sms_dispatcher():
+            sms_dispatcher.ensure_started(app)
+
+    # Request timers, SQL accounting and latency histograms (see /metrics/latency)
+    instrumentation.init_app(app)
+
+    # Enable CORS globally
+    CORS(app)
+
+    if blueprints is None:
+        selected = app.config['BLUEPRINTS']
+        if isinstance(selected, str):
+            selected = [name.strip() for name in selected.split(',') if name.strip()]
+        blueprints = selected or list(BLUEPRINTS)
+    register_blueprints(app, blueprints)
+    register_commands(app)
+    return app
+
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,60 @@
+"""
+Compare two benchmark reports (from benchmarks.micro or benchmarks.load --json).
+
+Every metric shared by both reports is listed with its change; *_ms metrics regress
+when they grow, *_per_s metrics when they shrink. Exits with status 1 if any metric
+regressed by more than --threshold percent, so it can gate CI against a baseline.
+
+Usage: python -m benchmarks.compare benchmarks/baselines/micro.json micro.json [--threshold 10]
+"""
+import argparse
+import sys
+
+from benchmarks.report import read_report
+
+
+def direction(metric):
+    """+1 if higher is better, -1 if lower is better, None for counts that aren't compared."""
+    if metric.endswith('_per_s'):
+        return 1
+    if metric.endswith('_ms'):
+        return -1
+    return None
+
+
+def compare(baseline, current, threshold):
+    """[(case, metric, old, new, percent change, regressed)] for metrics in both reports."""
+    rows = []
+    for case, metrics in baseline['results'].items():
+        for metric, old in metrics.items():
+            new = current['results'].get(case, {}).get(metric)
+            sign = direction(metric)
+            if sign is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append((case, metric, old, new, change, change * sign < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=10, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    baseline, current = read_report(args.baseline), read_report(args.current)
+    if baseline['benchmark'] != current['benchmark']:
+        parser.error(f"cannot compare a {baseline['benchmark']} report with a {current['benchmark']} report")
+
+    rows = compare(baseline, current, args.threshold)
+    for case, metric, old, new, change, regressed in rows:
+        print(f"{case:<36} {metric:<14} {old:>12,.2f} {new:>12,.2f} {change:>+8.1f}%{'  REGRESSED' if regressed else ''}")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} of {len(rows)} metrics regressed by more than {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measure crawl latency (p50/p99) with many fake shops crawled in parallel.
+
+Usage: python -m benchmarks.crawl_latency [--shops 12] [--runs 200]
+"""
+import argparse
+import statistics
+
+from services.crawler import FakeShopAdapter, crawl_shops
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_shops(count, latency, jitter, slow_shops, slow_latency, timeout):
+    shops = []
+    for i in range(count):
+        shop_latency = slow_latency if i < slow_shops else latency
+        shops.append(FakeShopAdapter(f"Shop {i}", latency=shop_latency, jitter=jitter, timeout=timeout, seed=i))
+    return shops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shops', type=int, default=12)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="base latency per shop (s)")
+    parser.add_argument('--jitter', type=float, default=0.05, help="random extra latency per shop (s)")
+    parser.add_argument('--slow-shops', type=int, default=1, help="number of shops that always miss the deadline")
+    parser.add_argument('--slow-latency', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=0.25, help="per-shop timeout (s)")
+    args = parser.parse_args()
+
+    shops = build_shops(args.shops, args.latency, args.jitter, args.slow_shops, args.slow_latency, args.timeout)
+
+    latencies = []
+    partial = 0
+    for _ in range(args.runs):
+        result = crawl_shops("Samsung A51", adapters=shops)
+        latencies.append(result.elapsed * 1000)
+        partial += result.partial
+
+    print(f"shops={args.shops} runs={args.runs} per-shop timeout={args.timeout * 1000:.0f}ms")
+    print(f"p50={percentile(latencies, 50):.1f}ms p99={percentile(latencies, 99):.1f}ms "
+          f"mean={statistics.mean(latencies):.1f}ms partial={partial}/{args.runs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Seed a database with synthetic users, products, search history and price history.
+
+Scales: 1k, 100k and 1m products, with one user per 100 products (at least 20),
+about 20 searches per user and 2 price changes per product. Data is deterministic
+for a given --seed. Every user can log in as user<N>@example.com with the password
+"benchmark", hashed with the server's BCRYPT_ROUNDS (use the same value for both).
+
+Usage: python -m benchmarks.datagen --database sqlite:///bench.db [--scale 100k] [--seed 0] [--reset]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app import create_app
+from model import FilterPreference, PriceHistory, Product, SearchHistory, SearchQuerySummary, User, db
+from services.passwords import password_hasher
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+PASSWORD = "benchmark"
+
+SHOPS = ["Jumia", "Kill Mall", "Masoko", "Kilimall Express", "Phone Place", "Avechi", "Hotpoint", "Carrefour"]
+BRANDS = ["Samsung", "Tecno", "Infinix", "Apple", "Xiaomi", "HP", "Lenovo", "Dell", "Sony", "LG", "Oppo", "Nokia"]
+KINDS = ["Phone", "Laptop", "TV", "Earbuds", "Fridge", "Speaker", "Watch", "Tablet", "Cooker", "Blender"]
+VARIANTS = ["32GB", "64GB", "128GB", "256GB", "43 inch", "55 inch", "4GB RAM", "8GB RAM", "Pro", "Max", "Lite"]
+PAYMENT_MODES = ["Pay before delivery", "Pay after delivery"]
+
+# Rows per INSERT batch and transaction
+BATCH_SIZE = 5000
+
+
+def search_queries(rng, count=500):
+    """The query vocabulary users search; popularity is skewed so a few queries dominate."""
+    queries = sorted({f"{rng.choice(BRANDS)} {rng.choice(KINDS)}".lower() for _ in range(count * 4)})
+    return queries + [f"{query} {variant.lower()}" for query in queries for variant in VARIANTS][:count]
+
+
+def popular(rng, queries):
+    """Pick a query with a Zipf-like skew towards the start of the list."""
+    return queries[min(int(rng.paretovariate(1.2)) - 1, len(queries) - 1)]
+
+
+def insert_batches(model, rows):
+    """Insert an iterable of row dicts in BATCH_SIZE chunks, one transaction each. Returns the row count."""
+    table, batch, count = model.__table__, [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(table), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(table), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+def users(rng, count, password_hash, now):
+    for number in range(1, count + 1):
+        yield {
+            "id": number,
+            "username": f"user{number}",
+            "email": f"user{number}@example.com",
+            "phone_number": 700000000 + number,
+            "password_hash": password_hash,
+            "created_at": now - timedelta(days=rng.randint(0, 365)),
+        }
+
+
+def products(rng, count, now):
+    for number in range(1, count + 1):
+        shop = SHOPS[number % len(SHOPS)]
+        yield {
+            "id": number,
+            "product_name": f"{rng.choice(BRANDS)} {rng.choice(KINDS)} {rng.choice(VARIANTS)} {rng.choice('ABCMSX')}{rng.randint(1, 99)}",
+            "product_price": round(rng.lognormvariate(9.5, 1.0), 2),
+            "product_rating": round(rng.uniform(1, 5), 1) if rng.random() < 0.9 else None,
+            "num_ratings": rng.randint(0, 2000),
+            "product_url": f"https://{shop.lower().replace(' ', '')}.example/p/{number}",
+            "delivery_cost": float(rng.choice([0, 100, 150, 200, 350])),
+            "shop_name": shop,
+            "payment_mode": rng.choice(PAYMENT_MODES),
+            "created_at": now - timedelta(days=rng.randint(0, 180)),
+        }
+
+
+def price_changes(rng, product_count, now, per_product=2):
+    for _ in range(product_count * per_product):
+        old_price = round(rng.lognormvariate(9.5, 1.0), 2)
+        yield {
+            "product_id": rng.randint(1, product_count),
+            "old_price": old_price,
+            "new_price": round(old_price * rng.uniform(0.7, 1.2), 2),
+            "change_date": now - timedelta(seconds=rng.randint(0, 90 * 86400)),
+        }
+
+
+def history(rng, user_count, queries, now, per_user=20):
+    """(SearchHistory rows, SearchQuerySummary rows) for every user."""
+    rows, summaries = [], {}
+    for user_id in range(1, user_count + 1):
+        for _ in range(rng.randint(per_user // 2, per_user * 3 // 2)):
+            query = popular(rng, queries)
+            searched = now - timedelta(seconds=rng.randint(0, 60 * 86400))
+            rows.append({"user_id": user_id, "search_query": query, "search_date": searched})
+            hits, last = summaries.get((user_id, query), (0, searched))
+            summaries[(user_id, query)] = (hits + 1, max(last, searched))
+    summary_rows = [
+        {"user_id": user_id, "search_query": query, "hit_count": hits, "last_searched": last}
+        for (user_id, query), (hits, last) in summaries.items()
+    ]
+    return rows, summary_rows
+
+
+def preferences(rng, user_count):
+    for user_id in range(1, user_count + 1, 3):
+        yield {"user_id": user_id, "preference_key": "sort", "preference_value": rng.choice(["price", "rating"])}
+        yield {"user_id": user_id, "preference_key": "order", "preference_value": rng.choice(["ascending", "descending"])}
+
+
+def seed(scale, seed_value=0):
+    """Fill the current app's database. Returns {table: rows inserted}."""
+    rng = random.Random(seed_value)
+    product_count = SCALES[scale]
+    user_count = max(product_count // 100, 20)
+    now = datetime.utcnow()
+    queries = search_queries(rng)
+
+    counts = {}
+    counts["users"] = insert_batches(User, users(rng, user_count, password_hasher.hash(PASSWORD), now))
+    counts["products"] = insert_batches(Product, products(rng, product_count, now))
+    counts["price_history"] = insert_batches(PriceHistory, price_changes(rng, product_count, now))
+    history_rows, summary_rows = history(rng, user_count, queries, now)
+    counts["search_history"] = insert_batches(SearchHistory, history_rows)
+    counts["search_query_summaries"] = insert_batches(SearchQuerySummary, summary_rows)
+    counts["filter_preferences"] = insert_batches(FilterPreference, preferences(rng, user_count))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', required=True, help="SQLAlchemy URL of the database to fill")
+    parser.add_argument('--scale', choices=list(SCALES), default='1k')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reset', action='store_true', help="drop and recreate every table first")
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database, 'DB_MIGRATIONS': False}, blueprints=[])
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        if db.session.execute(select(func.count()).select_from(Product)).scalar():
+            parser.error("the database already has products; pass --reset to start over")
+
+        start = time.perf_counter()
+        counts = seed(args.scale, args.seed)
+        elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        print(f"{table:<24} {count:>10,}")
+    print(f"seeded scale={args.scale} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Concurrent read/write load against SQLite with the default engine and with the tuned profile.
+
+Each worker thread runs a mix of listing reads and read-then-write price updates
+for a fixed time. Reports throughput, latency percentiles, "database is locked"
+errors and pool metrics.
+
+Usage: python -m benchmarks.db_concurrency [--threads 16] [--seconds 10] [--write-ratio 0.2]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.ingest import make_listings
+from model import PriceHistory, Product, db
+from services.db_profiles import init_database, pool_stats
+from services.ingest import upsert_products
+
+
+def read_listing(rng, products):
+    low = rng.uniform(1000, 45000)
+    Product.query.filter(Product.product_price >= low).order_by(Product.product_price).limit(20).all()
+
+
+def update_price(rng, products):
+    # Read first, then write: the pattern that trips SQLite's lock upgrade under load
+    product = db.session.get(Product, rng.randint(1, products))
+    new_price = round(product.product_price * rng.uniform(0.9, 1.1), 2)
+    db.session.add(PriceHistory(product_id=product.id, old_price=product.product_price, new_price=new_price))
+    product.product_price = new_price
+
+
+def worker(app, products, write_ratio, deadline, seed, results):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    update_price(rng, products)
+                    db.session.commit()
+                else:
+                    read_listing(rng, products)
+                    db.session.commit()
+                latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+        db.session.remove()
+    results.append((latencies, errors))
+
+
+def run(label, app, args):
+    with app.app_context():
+        db.create_all()
+        upsert_products(make_listings(args.products))
+
+    results = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=worker, args=(app, args.products, args.write_ratio, deadline, seed, results))
+        for seed in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in results)
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f"{label:<16} {len(latencies) / args.seconds:9.0f} ops/s  p50={p50:7.2f}ms  p99={p99:8.2f}ms  locked errors={errors}")
+    return pool_stats(app)
+
+
+def make_app(database_uri, profile=None):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if profile:
+        init_database(app, profile=profile)
+    else:
+        db.init_app(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--products', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"threads={args.threads} seconds={args.seconds} write ratio={args.write_ratio}")
+    with tempfile.TemporaryDirectory() as tmp:
+        run("default engine", make_app('sqlite:///' + os.path.join(tmp, 'default.db')), args)
+        tuned = make_app('sqlite:///' + os.path.join(tmp, 'tuned.db'), profile='sqlite')
+        stats = run("sqlite profile", tuned, args)
+        print(f"pool: {stats['default']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare the bulk upsert path with the old per-row filter_by().first() ingest.
+
+Usage: python -m benchmarks.ingest [--rows 10000] [--baseline-rows 2000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+
+from model import Product, db
+from services.ingest import upsert_products
+
+
+def make_app(database_uri):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def make_listings(count, shops=10, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "product_name": f"Product {i}",
+            "product_price": round(rng.uniform(1000, 50000), 2),
+            "product_rating": round(rng.uniform(1, 5), 1),
+            "num_ratings": rng.randint(0, 500),
+            "delivery_cost": float(rng.choice([0, 100, 150, 200])),
+            "payment_mode": rng.choice(["Pay before delivery", "Pay after delivery"]),
+            "shop_name": f"Shop {i % shops}",
+            "product_url": f"https://shop{i % shops}.example/p/{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def per_row_ingest(listings):
+    """The original N+1 ingest loop from search_products."""
+    for listing in listings:
+        existing = Product.query.filter_by(product_name=listing['product_name'], shop_name=listing['shop_name']).first()
+        if not existing:
+            db.session.add(Product(**listing))
+    db.session.commit()
+
+
+def timed(label, rows, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} rows={rows:<7} {elapsed * 1000:9.1f}ms  {rows / elapsed:10.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--baseline-rows', type=int, default=2000, help="rows for the slow per-row baseline (0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+
+            if args.baseline_rows:
+                timed("per-row insert", args.baseline_rows, per_row_ingest, make_listings(args.baseline_rows, seed=1))
+                Product.query.delete()
+                db.session.commit()
+
+            listings = make_listings(args.rows)
+            timed("bulk upsert (insert)", args.rows, upsert_products, listings)
+
+            # Second pass over the same keys with new prices exercises the ON CONFLICT update path
+            timed("bulk upsert (update)", args.rows, upsert_products, make_listings(args.rows, seed=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+HTTP load test across the blueprints: search, filtering, auth, payment and history.
+
+Worker processes, each running several keep-alive client threads, send a weighted
+mix of requests for a fixed time and report per-endpoint throughput, error counts
+and latency percentiles. Without --url a local server is started on --database
+(seed it first with benchmarks.datagen, using the same BCRYPT_ROUNDS); rate limits
+are raised for that server so they don't dominate the numbers.
+
+Usage: python -m benchmarks.load --database sqlite:///bench.db [--url http://127.0.0.1:5000]
+           [--processes 2] [--threads 8] [--duration 30] [--mix search=30,login=5] [--json load.json]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.report import latency_summary, write_report
+
+PASSWORD = "benchmark"
+
+# Scenario -> weight in the default request mix
+DEFAULT_MIX = {
+    'search': 25,
+    'search_miss': 2,
+    'apply_filters': 25,
+    'payment': 15,
+    'cart': 5,
+    'history': 10,
+    'price_history': 13,
+    'login': 5,
+}
+
+SERVER = """
+import sys
+from werkzeug.serving import make_server
+from app import create_app
+server = make_server('127.0.0.1', int(sys.argv[1]), create_app(), threaded=True)
+print('ready', flush=True)
+server.serve_forever()
+"""
+
+# Environment of a locally started server: no migrations, limits out of the way
+SERVER_ENV = {
+    'DB_MIGRATIONS': '0',
+    'SEARCH_IP_BURST': '1000000',
+    'SEARCH_IP_RATE': '1000000',
+    'SEARCH_USER_BURST': '1000000',
+    'SEARCH_USER_RATE': '1000000',
+    'CRAWL_BURST': '1000000',
+    'CRAWL_RATE': '1000000',
+}
+
+
+def search(rng, ctx):
+    return 'GET', f"/search?query={quote(rng.choice(ctx['queries']))}&limit=20", None, False
+
+
+def search_miss(rng, ctx):
+    # A query nobody searched before: crawl, ingest and ranking on the request path
+    return 'GET', f"/search?query=bench+{rng.getrandbits(48):x}", None, False
+
+
+def apply_filters(rng, ctx):
+    user_id = rng.randint(1, ctx['users'])
+    min_price = rng.choice([0, 1000, 5000, 20000])
+    return 'GET', f"/apply-filters?user_id={user_id}&min_price={min_price}&limit=20", None, False
+
+
+def payment(rng, ctx):
+    return 'POST', '/calculate-total-cost', {"product_id": rng.randint(1, ctx['products'])}, True
+
+
+def cart(rng, ctx):
+    items = [{"product_id": rng.randint(1, ctx['products']), "quantity": rng.randint(1, 3)} for _ in range(5)]
+    return 'POST', '/calculate-total-cost/batch', {"items": items}, True
+
+
+def history(rng, ctx):
+    return 'GET', '/get-search-history?limit=20', None, True
+
+
+def price_history(rng, ctx):
+    return 'GET', f"/price-history/{rng.randint(1, ctx['products'])}", None, False
+
+
+def login(rng, ctx):
+    number = rng.randint(1, ctx['users'])
+    return 'POST', '/login', {"email": f"user{number}@example.com", "password": PASSWORD}, False
+
+
+SCENARIOS = {
+    'search': search,
+    'search_miss': search_miss,
+    'apply_filters': apply_filters,
+    'payment': payment,
+    'cart': cart,
+    'history': history,
+    'price_history': price_history,
+    'login': login,
+}
+
+
+def send(connection, method, path, body=None, token=None):
+    headers = {}
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def client_thread(url, ctx, mix, seed, warmup_until, deadline, records):
+    rng = random.Random(seed)
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    names, weights = list(mix), list(mix.values())
+    while True:
+        name = rng.choices(names, weights)[0]
+        method, path, body, authenticated = SCENARIOS[name](rng, ctx)
+        token = rng.choice(ctx['tokens']) if authenticated else None
+        start = time.perf_counter()
+        if start >= deadline:
+            break
+        try:
+            status, _ = send(connection, method, path, body, token)
+        except (OSError, http.client.HTTPException):
+            status = 0
+            connection.close()
+        elapsed = time.perf_counter() - start
+        if start >= warmup_until:
+            records.append((name, status, elapsed))
+    connection.close()
+
+
+def run_worker(url, ctx, mix, threads, seed, warmup, duration):
+    """One load process: `threads` clients until the deadline. Returns (scenario, status, seconds) records."""
+    records = []
+    now = time.perf_counter()
+    warmup_until, deadline = now + warmup, now + warmup + duration
+    clients = [
+        threading.Thread(target=client_thread, args=(url, ctx, mix, seed * 1000 + number, warmup_until, deadline, records))
+        for number in range(threads)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return records
+
+
+def load_context(database, url, logged_in):
+    """Sizes and queries from the seeded database, plus tokens for some seeded users."""
+    engine = create_engine(database)
+    with engine.connect() as connection:
+        products = connection.execute(text("SELECT MAX(id) FROM products")).scalar() or 0
+        users = connection.execute(text("SELECT MAX(id) FROM users")).scalar() or 0
+        queries = connection.execute(text(
+            "SELECT search_query FROM search_query_summaries GROUP BY search_query ORDER BY SUM(hit_count) DESC LIMIT 50"
+        )).scalars().all()
+    engine.dispose()
+    if not products or not users:
+        raise SystemExit("The database has no products or users; seed it with benchmarks.datagen first")
+
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    tokens = []
+    for number in range(1, min(logged_in, users) + 1):
+        status, body = send(connection, 'POST', '/login', {"email": f"user{number}@example.com", "password": PASSWORD})
+        if status != 200:
+            raise SystemExit(f"Logging in user{number} failed ({status}); was the database seeded with the same BCRYPT_ROUNDS?")
+        tokens.append(json.loads(body)['access_token'])
+    connection.close()
+    return {"products": products, "users": users, "queries": queries or ["samsung phone"], "tokens": tokens}
+
+
+def start_server(database):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, DATABASE_URL=database, **SERVER_ENV)
+    server = subprocess.Popen([sys.executable, '-c', SERVER, str(port)], env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True)
+    if server.stdout.readline().strip() != 'ready':
+        server.kill()
+        raise SystemExit("The local server failed to start")
+    return server, f"http://127.0.0.1:{port}"
+
+
+def parse_mix(value):
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def summarize(records, duration):
+    by_scenario = {}
+    for name, status, elapsed in records:
+        by_scenario.setdefault(name, []).append((status, elapsed))
+    by_scenario['all'] = [(status, elapsed) for _, status, elapsed in records]
+
+    results = {}
+    for name, samples in sorted(by_scenario.items()):
+        statuses = Counter(status for status, _ in samples)
+        ok = [elapsed for status, elapsed in samples if 200 <= status < 400]
+        results[name] = dict(
+            latency_summary(ok),
+            requests=len(samples),
+            requests_per_s=round(len(samples) / duration, 1),
+            errors=sum(count for status, count in statuses.items() if not 200 <= status < 400 and status != 429),
+            rate_limited=statuses.get(429, 0),
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help="SQLAlchemy URL of the seeded database")
+    parser.add_argument('--url', help="server to load (default: start one locally on --database)")
+    parser.add_argument('--processes', type=int, default=2, help="load generating processes")
+    parser.add_argument('--threads', type=int, default=8, help="client threads per process")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=3, help="unmeasured seconds first")
+    parser.add_argument('--mix', type=parse_mix, default=None, help="scenario=weight,... (default: all scenarios)")
+    parser.add_argument('--logged-in', type=int, default=20, help="users logged in up front for authenticated requests")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write a JSON report here ('-' for stdout)")
+    args = parser.parse_args()
+    mix = args.mix or dict(DEFAULT_MIX)
+
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_server(args.database)
+    try:
+        ctx = load_context(args.database, url, args.logged_in)
+        print(f"{url}: {args.processes} processes x {args.threads} threads for {args.duration:g}s "
+              f"({ctx['products']:,} products, {ctx['users']:,} users)")
+        with multiprocessing.Pool(args.processes) as pool:
+            batches = pool.starmap(run_worker, [
+                (url, ctx, mix, args.threads, args.seed + number, args.warmup, args.duration)
+                for number in range(args.processes)
+            ])
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = summarize([record for batch in batches for record in batch], args.duration)
+    print(f"{'scenario':<16}{'req/s':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}{'429s':>7}")
+    for name, stats in results.items():
+        print(f"{name:<16}{stats['requests_per_s']:>9.1f}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['errors']:>8}{stats['rate_limited']:>7}")
+
+    if args.json:
+        args.mix = mix
+        write_report(args.json, 'load', args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Measure password verification (login) throughput per core.
+
+Compares hashing in the calling threads with the process-pool PasswordHasher.
+
+Usage: python -m benchmarks.login_throughput [--rounds 10] [--logins 200] [--threads 16]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.passwords import PasswordHasher
+
+
+def run(hasher, password_hash, logins, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: hasher.verify("correct horse", password_hash), range(logins)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16, help="concurrent login requests")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="hashing processes")
+    args = parser.parse_args()
+
+    inline = PasswordHasher(rounds=args.rounds, workers=0, max_pending=args.threads)
+    pooled = PasswordHasher(rounds=args.rounds, workers=args.workers, max_pending=args.threads)
+    password_hash = inline.hash("correct horse")
+
+    # Warm the pool so process start-up is not counted
+    pooled.verify("correct horse", password_hash)
+
+    print(f"bcrypt rounds={args.rounds} concurrent logins={args.threads} hashing processes={args.workers}")
+    for label, hasher, cores in (("request threads", inline, 1), ("process pool", pooled, args.workers)):
+        throughput = run(hasher, password_hash, args.logins, args.threads)
+        print(f"{label:<16} {throughput:8.1f} logins/s  {throughput / cores:8.1f} logins/s/core")
+    pooled.shutdown()
+
+
+if __name__ == "__main__":
+    main()
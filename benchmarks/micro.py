@@ -0,0 +1,151 @@
+"""
+Microbenchmarks for the hot paths behind the endpoints: scoring, ingest, clustering
+fingerprints and response serialization.
+
+Each case runs --repeat times on fixed synthetic data; the report gives the median
+and best time per run and items processed per second. New listings are ingested
+both with clustering (the CLUSTER_ON_INGEST default) and without, so its cost shows.
+Use --json to save a report for benchmarks.compare, and --cases to run a subset
+(prefix match).
+
+Usage: python -m benchmarks.micro [--repeat 5] [--cases scoring,ingest] [--json micro.json]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from flask import jsonify
+
+from app import create_app
+from benchmarks.ranking import make_candidates
+from benchmarks.report import write_report
+from model import db
+from services.clustering import fingerprint, minhash
+from services.ingest import upsert_products
+from services.ranking import rank_products, score_columns, to_columns
+from services.streaming import stream_response
+
+
+def make_listings(count, start=0, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "product_name": f"{rng.choice(['Samsung', 'Tecno', 'HP', 'Sony'])} {rng.choice(['Phone', 'Laptop', 'TV'])} {i}",
+            "product_price": round(rng.uniform(1000, 50000), 2),
+            "product_rating": round(rng.uniform(1, 5), 1),
+            "num_ratings": rng.randint(0, 500),
+            "delivery_cost": float(rng.choice([0, 100, 150, 200])),
+            "payment_mode": rng.choice(["Pay before delivery", "Pay after delivery"]),
+            "shop_name": f"Shop {i % 8}",
+            "product_url": f"https://shop{i % 8}.example/p/{i}",
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def time_runs(fn, repeat, setup=None):
+    timings = []
+    for run in range(repeat):
+        argument = setup(run) if setup else None
+        start = time.perf_counter()
+        fn(argument)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def scoring_cases(app):
+    products = make_candidates(10000)
+    columns = to_columns(products)
+    yield "scoring.score_columns", 10000, lambda _: score_columns(columns), None
+    yield "scoring.rank_top100", 10000, lambda _: rank_products(products, 100), None
+
+
+def ingest_cases(app):
+    size = 2000
+
+    def fresh(run):
+        return make_listings(size, start=(run + 1) * size * 10)
+
+    def repriced(run):
+        listings = make_listings(size)
+        if run == 0:
+            upsert_products(listings)  # The listings exist before the timed runs
+        for listing in listings:
+            listing['product_price'] = round(listing['product_price'] * (0.9 + run * 0.01), 2)
+        return listings
+
+    def fresh_unclustered(run):
+        return make_listings(size, start=(run + 1) * size * 10 + size)
+
+    yield "ingest.upsert_new", size, upsert_products, fresh
+    yield "ingest.upsert_new_unclustered", size, lambda listings: upsert_products(listings, cluster=False), fresh_unclustered
+    yield "ingest.upsert_repriced", size, upsert_products, repriced
+
+
+def clustering_cases(app):
+    names = [listing['product_name'] + " 128GB Black" for listing in make_listings(2000)]
+
+    def fingerprints(_):
+        fingerprint.cache_clear()
+        for name in names:
+            minhash(fingerprint(name).shingles)
+
+    yield "clustering.fingerprint_minhash", len(names), fingerprints, None
+
+
+def serialization_cases(app):
+    results = [dict(product, rank=i, mb_score=1.0, cb_score=2.0) for i, product in enumerate(make_candidates(100))]
+    rows = make_candidates(10000)
+
+    def ndjson(_):
+        with app.test_request_context():
+            stream_response(iter(rows), 'ndjson').get_data()
+
+    yield "serialize.jsonify_search_results", len(results), lambda _: jsonify(results).get_data(), None
+    yield "serialize.ndjson_stream", len(rows), ndjson, None
+
+
+CASES = (scoring_cases, ingest_cases, clustering_cases, serialization_cases)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cases', help="comma-separated case name prefixes")
+    parser.add_argument('--json', help="write a JSON report here ('-' for stdout)")
+    args = parser.parse_args()
+    prefixes = [prefix.strip() for prefix in args.cases.split(',')] if args.cases else None
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'micro.db'),
+            'DB_MIGRATIONS': False,
+        }, blueprints=[])
+        with app.app_context():
+            db.create_all()
+
+        for cases in CASES:
+            for name, items, fn, setup in cases(app):
+                if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+                    continue
+                with app.app_context():
+                    timings = time_runs(fn, args.repeat, setup)
+                median = statistics.median(timings)
+                results[name] = {
+                    "median_ms": round(median * 1000, 3),
+                    "min_ms": round(min(timings) * 1000, 3),
+                    "items_per_s": round(items / median, 1),
+                }
+                print(f"{name:<36} {median * 1000:9.2f}ms median  {min(timings) * 1000:9.2f}ms best"
+                      f"  {items / median:12,.0f} items/s")
+
+    if args.json:
+        write_report(args.json, 'micro', args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Match synthetic price drops against a large population of synthetic watchers.
+
+Builds an AlertIndex in memory (no database) from implicit followers and explicit
+alerts over a vocabulary of product words, then matches a stream of price changes.
+Reports build time, match throughput and notifications produced.
+
+Usage: python -m benchmarks.price_alerts [--watchers 1000000] [--changes 100000]
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from services.price_alerts import AlertIndex
+
+BRANDS = ["samsung", "tecno", "infinix", "apple", "xiaomi", "hp", "lenovo", "dell", "sony", "lg", "oppo", "nokia"]
+KINDS = ["phone", "laptop", "tv", "earbuds", "fridge", "speaker", "watch", "tablet", "cooker", "blender"]
+SIZES = ["32gb", "64gb", "128gb", "256gb", "43 inch", "55 inch", "4gb ram", "8gb ram", "pro", "max", "lite"]
+
+
+def make_queries(count, rng):
+    queries = set()
+    while len(queries) < count:
+        words = [rng.choice(BRANDS), rng.choice(KINDS)]
+        if rng.random() < 0.6:
+            words.append(rng.choice(SIZES))
+        if rng.random() < 0.5:
+            words.append(f"{rng.choice('abcmsx')}{rng.randint(1, 99)}")
+        queries.add(' '.join(words))
+    return sorted(queries)
+
+
+def make_changes(count, rng):
+    changes = []
+    for product_id in range(count):
+        name = f"{rng.choice(BRANDS).title()} {rng.choice(KINDS).title()} {rng.choice(SIZES)} " \
+               f"{rng.choice('abcmsx').upper()}{rng.randint(1, 99)} {rng.choice(['Black', 'Blue', 'Silver'])}"
+        old_price = round(rng.uniform(2000, 150000), 2)
+        new_price = round(old_price * rng.uniform(0.6, 1.1), 2)
+        changes.append((product_id, name, old_price, new_price))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--watchers', type=int, default=1000000, help="user/query pairs watched")
+    parser.add_argument('--queries', type=int, default=50000, help="distinct watched queries")
+    parser.add_argument('--alert-ratio', type=float, default=0.1, help="share of watchers with explicit alerts")
+    parser.add_argument('--changes', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queries = make_queries(args.queries, rng)
+    watchers = [(user_id, rng.choice(queries)) for user_id in range(args.watchers)]
+    changes = make_changes(args.changes, rng)
+
+    start = time.perf_counter()
+    index = AlertIndex()
+    index.count_tokens(queries)
+    for user_id, query in watchers:
+        if rng.random() < args.alert_ratio:
+            index.add_alert(SimpleNamespace(
+                id=user_id, user_id=user_id, search_query=query,
+                max_price=round(rng.uniform(2000, 150000), -2) if rng.random() < 0.5 else None,
+                min_drop_percent=rng.choice([None, 5.0, 15.0, 25.0]),
+            ))
+        else:
+            index.add_follower(query, user_id)
+    build = time.perf_counter() - start
+    print(f"index: {len(index)} queries, {index.watchers} watchers, built in {build:.2f}s")
+
+    start = time.perf_counter()
+    matched, notified = 0, set()
+    for product_id, name, old_price, new_price in changes:
+        for user_id, _, _ in index.match(name, old_price, new_price):
+            matched += 1
+            notified.add(user_id)
+    elapsed = time.perf_counter() - start
+    print(f"matched {len(changes)} changes in {elapsed:.2f}s ({len(changes) / elapsed:,.0f} changes/s)"
+          f"  matches={matched:,}  users notified={len(notified):,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Time batch MB/CB scoring and top-k selection against the old per-row score + full sort.
+
+Usage: python -m benchmarks.ranking [--candidates 100000] [--limit 100]
+"""
+import argparse
+import random
+import time
+
+from services.ranking import rank_products
+
+
+def make_candidates(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "product_name": f"Product {i}",
+            "product_price": rng.uniform(1000, 50000),
+            "product_rating": rng.uniform(1, 5),
+            "num_ratings": rng.randint(0, 500),
+            "delivery_cost": rng.choice([0.0, 100.0, 150.0, 200.0]),
+            "shop_name": f"Shop {i % 10}",
+        }
+        for i in range(count)
+    ]
+
+
+def per_row_rank(products):
+    """The original approach: score one dict at a time, then sort everything."""
+    scored = []
+    for product in products:
+        mb_score = product['product_rating'] * 10 + product['num_ratings'] / 10
+        cb_score = product['product_price'] / max(product['delivery_cost'], 1.0)
+        scored.append((mb_score, cb_score, product))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored
+
+
+def best_of(fn, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--candidates', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    products = make_candidates(args.candidates)
+    print(f"candidates={args.candidates} limit={args.limit}")
+    print(f"per-row score + full sort  {best_of(per_row_rank, products):8.1f}ms")
+    print(f"batch score + top-k        {best_of(rank_products, products, args.limit):8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
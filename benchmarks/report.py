@@ -0,0 +1,52 @@
+"""
+JSON reports shared by the benchmark suite (micro, load) and read by benchmarks.compare.
+
+A report is {"benchmark": ..., "meta": {...}, "results": {case: {metric: value}}}.
+Metric names carry their direction: *_ms lower is better, *_per_s higher is better.
+"""
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(len(sorted_values) * percent / 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(latencies):
+    """Milliseconds at the usual percentiles for a list of durations in seconds."""
+    latencies = sorted(latencies)
+    summary = {f"p{percent:g}_ms": round(percentile(latencies, percent) * 1000, 3) for percent in (50, 90, 99)}
+    summary["max_ms"] = round(latencies[-1] * 1000, 3) if latencies else 0.0
+    return summary
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "date": datetime.utcnow().isoformat(timespec='seconds'),
+    }
+
+
+def write_report(path, benchmark, args, results):
+    report = {"benchmark": benchmark, "meta": dict(environment(), args=vars(args)), "results": results}
+    if path == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+        return
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def read_report(path):
+    with open(path) as f:
+        return json.load(f)
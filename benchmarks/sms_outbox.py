@@ -0,0 +1,62 @@
+"""
+Drain an SMS outbox against the offline fake gateway and report throughput and retries.
+
+Usage: python -m benchmarks.sms_outbox [--messages 5000] [--failure-rate 0.1]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# Retry quickly so retry behaviour shows up within a short run
+os.environ.setdefault("SMS_RETRY_BASE", "0.01")
+os.environ.setdefault("SMS_RETRY_MAX", "0.1")
+
+from flask import Flask
+from sqlalchemy import func, insert
+
+from model import SmsOutbox, db
+from services.sms_outbox import FakeSmsGateway, SmsDispatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--distinct-messages', type=int, default=50, help="distinct texts (recipients are batched per text)")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help="gateway latency per call (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="share of gateway calls that fail")
+    parser.add_argument('--recipient-failure-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        db.init_app(app)
+
+        gateway = FakeSmsGateway(args.latency, args.failure_rate, args.recipient_failure_rate, seed=0)
+        dispatcher = SmsDispatcher(gateway=gateway, batch_size=args.batch_size)
+
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(SmsOutbox), [
+                {"phone_number": f"+2547{i:08d}", "message": f"Your code is {i % args.distinct_messages}"}
+                for i in range(args.messages)
+            ])
+            db.session.commit()
+
+            start = time.perf_counter()
+            while db.session.query(SmsOutbox).filter(SmsOutbox.status.in_(('pending', 'sending'))).count():
+                if not dispatcher.dispatch_once():
+                    time.sleep(0.01)  # Waiting for backoff to expire
+            elapsed = time.perf_counter() - start
+
+            statuses = dict(db.session.query(SmsOutbox.status, func.count()).group_by(SmsOutbox.status).all())
+            attempts = db.session.query(func.sum(SmsOutbox.attempts)).scalar()
+
+    print(f"messages={args.messages} gateway calls={gateway.calls} attempts={attempts} elapsed={elapsed:.2f}s")
+    print(f"throughput={args.messages / elapsed:.0f} msg/s statuses={statuses}")
+
+
+if __name__ == "__main__":
+    main()
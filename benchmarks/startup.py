@@ -0,0 +1,84 @@
+"""
+Measure worker startup cost: importing app.py and building the app with create_app().
+
+Each worker shape runs in fresh interpreters; reports the median time to a ready
+app, the number of modules loaded, and the heaviest top-level imports.
+
+Usage: python -m benchmarks.startup [--runs 5] [--top 8]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# name -> (config, blueprints)
+WORKERS = {
+    'full (with migrations)': ({}, None),
+    'full': ({'DB_MIGRATIONS': False}, None),
+    'product search only': ({'DB_MIGRATIONS': False}, ['product']),
+    'auth only': ({'DB_MIGRATIONS': False}, ['auth']),
+}
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app({config!r}, {blueprints!r})
+print(json.dumps({{
+    "elapsed": time.perf_counter() - start,
+    "modules": len(sys.modules),
+    "sms_sdk_loaded": "africastalking" in sys.modules,
+}}))
+"""
+
+
+def run_child(config, blueprints, env, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD.format(config=config, blueprints=blueprints)]
+    result = subprocess.run(command, capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def heaviest_imports(stderr, top):
+    """
+    Modules imported by app.py (and by the interpreter itself), by cumulative import
+    time in microseconds, from -X importtime output.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # importtime indents two spaces per level
+        if depth <= 1 and name.strip() != 'app':
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help="heaviest imports to list per worker")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=root, DATABASE_URL='sqlite:///' + os.path.join(tmp, 'startup.db'))
+        for label, (config, blueprints) in WORKERS.items():
+            samples = [run_child(config, blueprints, env)[0] for _ in range(args.runs)]
+            elapsed = statistics.median(sample['elapsed'] for sample in samples)
+            print(f"{label:<24} {elapsed * 1000:8.1f}ms  modules={samples[0]['modules']:<5}"
+                  f" sms sdk loaded={samples[0]['sms_sdk_loaded']}")
+
+            _, stderr = run_child(config, blueprints, env, importtime=True)
+            for cumulative, name in heaviest_imports(stderr, args.top):
+                print(f"    {cumulative / 1000:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
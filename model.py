@@ -1,12 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from flask_bcrypt import Bcrypt
+from services.db_routing import RoutingSession
+from services.passwords import password_hasher
 
-# Initialize db
-db = SQLAlchemy()
-
-# Initialize bcrypt
-bcrypt = Bcrypt()
+# Initialize db; the session routes @read_only requests to replica binds when there are any
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # User Model
 class User(db.Model):
@@ -25,12 +23,15 @@ class User(db.Model):
     auth_tokens = db.relationship('AuthToken', backref='user', lazy=True)
 
     def set_password(self, password):
-        # Use bcrypt to hash the password
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        # Hashing runs on the shared password-hashing worker pool
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        # Use bcrypt to check the password
-        return bcrypt.check_password_hash(self.password_hash, password)
+        # Hashes with an outdated cost are upgraded in place; the caller commits
+        valid, new_hash = password_hasher.verify_and_update(password, self.password_hash)
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -47,29 +48,109 @@ class SearchHistory(db.Model):
     def __repr__(self):
         return f'<SearchHistory {self.search_query}>'
 
+    def to_dict(self):
+        return {"id": self.id, "search_query": self.search_query, "search_date": self.search_date}
+
+# Serves a user's most recent searches first (and keyset pagination through them)
+db.Index('ix_search_history_user_date', SearchHistory.user_id, SearchHistory.search_date.desc(), SearchHistory.id.desc())
+
+# Search Query Summary Model (per-user query counts, maintained as history is written)
+class SearchQuerySummary(db.Model):
+    __tablename__ = 'search_query_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'search_query', name='uq_search_query_summaries_user_query'),
+        db.Index('ix_search_query_summaries_user_last', 'user_id', 'last_searched'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    search_query = db.Column(db.String(255), nullable=False)  # Normalized query
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    last_searched = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SearchQuerySummary {self.search_query} x{self.hit_count}>'
+
+    def to_dict(self):
+        return {"search_query": self.search_query, "hit_count": self.hit_count, "last_searched": self.last_searched}
+
 # Product Model (represents products from e-commerce sites)
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # A listing is identified by its shop and URL; used as the upsert conflict target
+        db.UniqueConstraint('shop_name', 'product_url', name='uq_products_shop_url'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(255), nullable=False)
     product_price = db.Column(db.Float, nullable=False)
     product_rating = db.Column(db.Float, nullable=True)
+    num_ratings = db.Column(db.Integer, nullable=True, default=0)
     product_url = db.Column(db.String(512), nullable=False)
     delivery_cost = db.Column(db.Float, nullable=False)
     shop_name = db.Column(db.String(100), nullable=False)  # e.g., 'Jumia', 'eBay', etc.
     payment_mode = db.Column(db.String(50), nullable=False)  # Pay before delivery / Pay after delivery
+    cluster_id = db.Column(db.Integer, db.ForeignKey('product_clusters.id'), nullable=True, index=True)  # Same item across shops
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f'<Product {self.product_name}>'
 
+# Indexes backing the keyset-paginated /apply-filters listing (sort key + id tie-breaker)
+db.Index('ix_products_price_id', Product.product_price, Product.id)
+db.Index('ix_products_rating_id', db.func.coalesce(Product.product_rating, 0.0), Product.id)
+db.Index('ix_products_shop_price_id', Product.shop_name, Product.product_price, Product.id)
+db.Index('ix_products_payment_price_id', Product.payment_mode, Product.product_price, Product.id)
+
+# Product Cluster Model (one canonical product, listed by one or more shops)
+class ProductCluster(db.Model):
+    __tablename__ = 'product_clusters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    canonical_name = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    products = db.relationship('Product', backref='cluster', lazy=True)
+
+    def __repr__(self):
+        return f'<ProductCluster {self.canonical_name}>'
+
+# Product Bucket Model (MinHash LSH band buckets used to find clustering candidates)
+class ProductBucket(db.Model):
+    __tablename__ = 'product_lsh_buckets'
+    __table_args__ = (
+        db.Index('ix_product_lsh_buckets_bucket', 'bucket', 'product_id'),
+    )
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductBucket {self.product_id}:{self.band}>'
+
+# Filter Preference Model (per-user sort/filter settings for product listings)
+class FilterPreference(db.Model):
+    __tablename__ = 'filter_preferences'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'preference_key', name='uq_filter_preferences_user_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    preference_key = db.Column(db.String(50), nullable=False)  # e.g., 'price', 'rating', 'shop'
+    preference_value = db.Column(db.String(100), nullable=False)  # e.g., 'ascending', 'descending'
+
+    def __repr__(self):
+        return f'<FilterPreference {self.preference_key}={self.preference_value}>'
+
 # Product Search Model (temporary index of product search results)
 class ProductSearch(db.Model):
     __tablename__ = 'product_searches'
 
     id = db.Column(db.Integer, primary_key=True)
-    search_query = db.Column(db.String(255), nullable=False)
+    search_query = db.Column(db.String(255), nullable=False, unique=True, index=True)  # Normalized query
     query_results = db.Column(db.JSON, nullable=False)  # JSON for storing search results dynamically
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -79,22 +160,62 @@ class ProductSearch(db.Model):
 # Authentication Tokens Model (JWT token storage)
 class AuthToken(db.Model):
     __tablename__ = 'auth_tokens'
+    __table_args__ = (
+        db.Index('ix_auth_tokens_revoked_at', 'revoked_at', 'expires_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(512), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    token = db.Column(db.String(512), nullable=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True, index=True)  # JWT id claim
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=True)
 
-    # Relationship
-    user = db.relationship('User', backref='auth_tokens', lazy=True)
+    def __repr__(self):
+        return f'<AuthToken {self.jti}>'
+
+# Password Reset Model (short-lived tokens sent by SMS)
+class PasswordReset(db.Model):
+    __tablename__ = 'password_resets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    token = db.Column(db.String(16), nullable=False)
+    expiration = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PasswordReset user={self.user_id}>'
+
+# SMS Outbox Model (messages waiting to be sent by the background dispatcher)
+class SmsOutbox(db.Model):
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (
+        # The dispatcher polls for due messages by status and time
+        db.Index('ix_sms_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    phone_number = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(480), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending / sending / sent / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
 
     def __repr__(self):
-        return f'<AuthToken {self.token[:10]}>'
+        return f'<SmsOutbox {self.phone_number} {self.status}>'
 
 # Price History Model (tracks price changes over time)
 class PriceHistory(db.Model):
     __tablename__ = 'price_history'
+    __table_args__ = (
+        # Covers time-window queries per product, including the price itself
+        db.Index('ix_price_history_product_date', 'product_id', 'change_date', 'new_price'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
@@ -108,16 +229,57 @@ class PriceHistory(db.Model):
     def __repr__(self):
         return f'<PriceHistory {self.old_price} -> {self.new_price}>'
 
+# Price Alert Model (notify a user when products matching a query drop in price)
+class PriceAlert(db.Model):
+    __tablename__ = 'price_alerts'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'search_query', name='uq_price_alerts_user_query'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    search_query = db.Column(db.String(255), nullable=False)  # Normalized query
+    max_price = db.Column(db.Float, nullable=True)  # Alert when the price falls to this or below...
+    min_drop_percent = db.Column(db.Float, nullable=True)  # ...or drops by at least this much
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_notified_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<PriceAlert {self.search_query}>'
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "search_query": self.search_query,
+            "max_price": self.max_price,
+            "min_drop_percent": self.min_drop_percent,
+            "active": self.active,
+            "last_notified_at": self.last_notified_at,
+        }
+
 # Ranked Product Model (stores ranking, MB, CB scores)
 class RankedProduct(db.Model):
     __tablename__ = 'ranked_products'
+    __table_args__ = (
+        # One ranking row per product per query; rows are updated in place on re-crawl
+        db.UniqueConstraint('search_query', 'product_id', name='uq_ranked_products_query_product'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    search_query = db.Column(db.String(255), nullable=True, index=True)  # Normalized query
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     mb_score = db.Column(db.Float, nullable=False)
     cb_score = db.Column(db.Float, nullable=False)
     rank = db.Column(db.Integer, nullable=False)
 
+    # Inputs the scores were computed from, used to skip rescoring unchanged products
+    product_price = db.Column(db.Float, nullable=True)
+    product_rating = db.Column(db.Float, nullable=True)
+    num_ratings = db.Column(db.Integer, nullable=True)
+    delivery_cost = db.Column(db.Float, nullable=True)
+    ranked_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last crawl that included the product
+
     # Relationship
     product = db.relationship('Product', backref='ranked_products', lazy=True)
 
@@ -0,0 +1,269 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy import select
+
+from model import AuthToken, db
+
+# Decoded tokens kept in memory (LRU)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# How often revocations made by other processes are picked up (seconds)
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+
+# How often expired tokens are deleted from auth_tokens (seconds)
+TOKEN_PURGE_INTERVAL = float(os.getenv("TOKEN_PURGE_INTERVAL", "3600"))
+
+# Rows deleted per statement while purging, to keep transactions short
+PURGE_BATCH_SIZE = 5000
+
+# Bloom filter size: 2**20 bits (128 KiB) and 7 probes keep false positives under 1%
+# for ~100k revoked tokens; false positives only cost an exact-set lookup
+BLOOM_BITS = 1 << 20
+BLOOM_HASHES = 7
+
+_PROBES = struct.Struct(f'<{BLOOM_HASHES}I')
+
+
+def token_digest(token):
+    """Cache key for a raw token; the token itself is never kept as a key."""
+    return hashlib.sha256(token.encode()).digest()
+
+
+def bearer_token(header):
+    """Extract the token from an 'Authorization: Bearer <token>' header value."""
+    if not header:
+        return None
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+class BloomFilter:
+    def __init__(self, bits=BLOOM_BITS):
+        self.bits = bits
+        self._array = bytearray(bits // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=_PROBES.size).digest()
+        return [probe % self.bits for probe in _PROBES.unpack(digest)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationIndex:
+    """
+    In-memory mirror of revoked token ids (jti), synced from AuthToken.revoked_at.
+
+    A bloom filter answers the common "not revoked" case; hits are confirmed against
+    the exact set. A background thread picks up revocations from other processes
+    every REVOCATION_SYNC_INTERVAL seconds and purges expired tokens from the table
+    every TOKEN_PURGE_INTERVAL seconds, rebuilding the filter without them.
+    """
+
+    def __init__(self, sync_interval=REVOCATION_SYNC_INTERVAL, purge_interval=TOKEN_PURGE_INTERVAL):
+        self.sync_interval = sync_interval
+        self.purge_interval = purge_interval
+        self._bloom = BloomFilter()
+        self._revoked = {}  # jti -> expires_at
+        self._synced_until = None  # Latest revoked_at seen
+        self._last_purge = time.monotonic()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._app = None
+        self._thread = None
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def is_revoked(self, jti):
+        if jti is None:
+            return False
+        self._ensure_started()
+        return jti in self._bloom and jti in self._revoked
+
+    def add(self, jti, expires_at):
+        """Block a token in this process right away (other processes pick it up on sync)."""
+        with self._lock:
+            self._bloom.add(jti)
+            self._revoked[jti] = expires_at
+
+    def sync(self):
+        """Load revocations recorded since the last sync. Needs an app context."""
+        query = select(AuthToken.jti, AuthToken.expires_at, AuthToken.revoked_at).where(
+            AuthToken.revoked_at.isnot(None), AuthToken.expires_at > datetime.utcnow()
+        )
+        if self._synced_until is not None:
+            # >= so revocations committed in the same instant are not skipped
+            query = query.where(AuthToken.revoked_at >= self._synced_until)
+        rows = db.session.execute(query).all()
+        db.session.commit()
+        for jti, expires_at, revoked_at in rows:
+            self.add(jti, expires_at)
+            if self._synced_until is None or revoked_at > self._synced_until:
+                self._synced_until = revoked_at
+        return len(rows)
+
+    def rebuild(self):
+        """Reload the whole index, dropping tokens that have expired."""
+        bloom, revoked, synced_until = BloomFilter(self._bloom.bits), {}, None
+        query = select(AuthToken.jti, AuthToken.expires_at, AuthToken.revoked_at).where(
+            AuthToken.revoked_at.isnot(None), AuthToken.expires_at > datetime.utcnow()
+        )
+        for jti, expires_at, revoked_at in db.session.execute(query).yield_per(PURGE_BATCH_SIZE):
+            bloom.add(jti)
+            revoked[jti] = expires_at
+            if synced_until is None or revoked_at > synced_until:
+                synced_until = revoked_at
+        db.session.commit()
+        with self._lock:
+            self._bloom, self._revoked, self._synced_until = bloom, revoked, synced_until
+
+    def purge_expired(self, batch_size=PURGE_BATCH_SIZE):
+        """Delete expired tokens in short batches and rebuild the index. Returns the rows removed."""
+        now = datetime.utcnow()
+        removed = 0
+        while True:
+            batch = select(AuthToken.id).where(AuthToken.expires_at < now).limit(batch_size)
+            deleted = AuthToken.query.filter(AuthToken.id.in_(batch)).delete(synchronize_session=False)
+            db.session.commit()
+            removed += deleted
+            if deleted < batch_size:
+                break
+        self.rebuild()
+        self._last_purge = time.monotonic()
+        return removed
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = current_app._get_current_object()
+            self._thread = threading.Thread(target=self._run, name='token-revocations', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        with self._app.app_context():
+            try:
+                self.rebuild()
+            except Exception:
+                self._app.logger.exception("Loading token revocations failed")
+        while not self._stopped.wait(self.sync_interval):
+            try:
+                with self._app.app_context():
+                    if time.monotonic() - self._last_purge >= self.purge_interval:
+                        self.purge_expired()
+                    else:
+                        self.sync()
+            except Exception:
+                self._app.logger.exception("Syncing token revocations failed")
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class TokenCache:
+    """
+    Verified JWT claims keyed by token hash, kept until the token expires.
+
+    The signature is checked once per token; later requests with the same token
+    cost a hash, a dict lookup and a revocation check.
+    """
+
+    def __init__(self, revocations, max_entries=AUTH_CACHE_SIZE):
+        self.revocations = revocations
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> claims
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token):
+        """Return the token's claims, or None if it is invalid, expired or revoked."""
+        if not token:
+            return None
+        key = token_digest(token)
+
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if claims is None:
+            self.misses += 1
+            try:
+                claims = decode_token(token)
+            except (JWTExtendedException, PyJWTError):
+                return None
+            with self._lock:
+                self._entries[key] = claims
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        if claims.get('exp') is not None and claims['exp'] <= time.time():
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        if self.revocations.is_revoked(claims.get('jti')):
+            return None
+        return claims
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token_digest(token), None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def issue_token(user_id):
+    """
+    Create an access token and record it in auth_tokens (in the current transaction)
+    so it can be revoked later. Returns the encoded token.
+    """
+    token = create_access_token(identity=user_id)
+    claims = token_cache.verify(token)  # Also warms the cache for the client's first request
+    db.session.add(AuthToken(
+        jti=claims['jti'],
+        user_id=user_id,
+        expires_at=datetime.utcfromtimestamp(claims['exp']),
+    ))
+    return token
+
+
+def revoke_token(claims):
+    """
+    Revoke a token given its claims. The revocation is written in the current
+    transaction and applied to this process immediately.
+    """
+    now = datetime.utcnow()
+    expires_at = datetime.utcfromtimestamp(claims['exp'])
+    updated = AuthToken.query.filter_by(jti=claims['jti']).update({'revoked_at': now}, synchronize_session=False)
+    if not updated:
+        # Issued before tokens were recorded
+        db.session.add(AuthToken(jti=claims['jti'], user_id=claims['sub'], expires_at=expires_at, revoked_at=now))
+    revocation_index.add(claims['jti'], expires_at)
+
+
+revocation_index = RevocationIndex()
+token_cache = TokenCache(revocation_index)
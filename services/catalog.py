@@ -0,0 +1,305 @@
+import csv
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import select
+
+from model import Product, db
+from services.ingest import PRODUCT_COLUMNS, upsert_products
+from services.price_alerts import alert_engine
+
+# Feed records validated per worker task and committed per transaction
+IMPORT_CHUNK_SIZE = int(os.getenv("CATALOG_CHUNK_SIZE", "5000"))
+
+# Validated chunks waiting to be committed, per worker; bounds memory on multi-GB feeds
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# Rows fetched per keyset page on export
+EXPORT_BATCH_SIZE = 5000
+
+# Rejected records kept in the import summary (all of them go to the rejects file)
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+# Limits mirror the Product columns
+TEXT_LIMITS = {'product_name': 255, 'product_url': 512, 'shop_name': 100, 'payment_mode': 50}
+
+
+class CatalogError(Exception):
+    """The feed, its format or its checkpoint can't be used."""
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise CatalogError(f"Can't tell the format of {path}; pass --format csv or --format ndjson")
+    return FORMATS[extension]
+
+
+def _text(record, column):
+    value = record.get(column)
+    value = value.strip() if isinstance(value, str) else value
+    if not value or not isinstance(value, str):
+        raise ValueError(f"{column} is required")
+    if len(value) > TEXT_LIMITS[column]:
+        raise ValueError(f"{column} is longer than {TEXT_LIMITS[column]} characters")
+    return value
+
+
+def _number(record, column, default=None, low=0.0, high=math.inf):
+    value = record.get(column)
+    if value is None or value == '':
+        if default is None:
+            raise ValueError(f"{column} is required")
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{column} is not a number: {value!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"{column} is not a finite number: {value}")
+    if not low <= value <= high:
+        raise ValueError(f"{column} is out of range: {value}")
+    return value
+
+
+def clean_row(record):
+    """Coerce one feed record into a product row; raises ValueError with the reason."""
+    price = _number(record, 'product_price')
+    if price <= 0:
+        raise ValueError(f"product_price must be positive: {price}")
+    num_ratings = _number(record, 'num_ratings', default=0.0)
+    if not num_ratings.is_integer():
+        raise ValueError(f"num_ratings is not a whole number: {num_ratings}")
+    rating = record.get('product_rating')
+    return {
+        'product_name': _text(record, 'product_name'),
+        'product_price': price,
+        'product_rating': None if rating in (None, '') else _number(record, 'product_rating', high=5.0),
+        'num_ratings': int(num_ratings),
+        'product_url': _text(record, 'product_url'),
+        'delivery_cost': _number(record, 'delivery_cost', default=0.0),
+        'shop_name': _text(record, 'shop_name'),
+        'payment_mode': _text(record, 'payment_mode'),
+    }
+
+
+def validate_chunk(records):
+    """
+    Worker task: parse and clean a chunk of feed records.
+    Returns (rows, errors) with errors as (position in chunk, reason).
+    """
+    rows, errors = [], []
+    for position, record in enumerate(records):
+        try:
+            if isinstance(record, str):  # NDJSON lines are parsed in the worker too
+                record = json.loads(record)
+                if not isinstance(record, dict):
+                    raise ValueError("record is not a JSON object")
+            rows.append(clean_row(record))
+        except ValueError as exc:
+            errors.append((position, str(exc)))
+    return rows, errors
+
+
+def read_feed(path, fmt, offset=0):
+    """
+    Stream (record, end offset) pairs from a CSV or NDJSON feed, starting at a byte
+    offset taken from a checkpoint. CSV records are dicts keyed by the header row;
+    NDJSON records are left as raw lines for the workers to parse.
+    """
+    with open(path, 'rb') as feed:
+        if fmt == 'csv':
+            header = next(csv.reader([feed.readline().decode('utf-8-sig')]), None)
+            if not header:
+                return
+            header = [column.strip() for column in header]
+            offset = max(offset, feed.tell())
+        feed.seek(offset)
+        consumed = [offset]
+
+        def lines():
+            for line in feed:
+                consumed[0] += len(line)
+                yield line.decode('utf-8')
+
+        if fmt == 'csv':
+            # The reader pulls lines lazily, so `consumed` ends exactly after each record
+            for values in csv.reader(lines()):
+                if values:
+                    yield dict(zip(header, values)), consumed[0]
+        else:
+            for line in lines():
+                if line.strip():
+                    yield line, consumed[0]
+
+
+def read_chunks(records, chunk_size):
+    """Group (record, end offset) pairs into (records, end offset of the last one) chunks."""
+    chunk, offset = [], None
+    for record, offset in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk, offset
+            chunk = []
+    if chunk:
+        yield chunk, offset
+
+
+def validated_chunks(chunks, workers):
+    """
+    Validate chunks in worker processes, yielding (rows, errors, records, end offset)
+    in feed order. At most CHUNKS_IN_FLIGHT_PER_WORKER chunks per worker are
+    outstanding, so a fast reader can't run ahead of the database.
+    """
+    if not workers:
+        for chunk, offset in chunks:
+            rows, errors = validate_chunk(chunk)
+            yield rows, errors, len(chunk), offset
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk, offset in chunks:
+            pending.append((executor.submit(validate_chunk, chunk), len(chunk), offset))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                future, count, end = pending.popleft()
+                yield future.result() + (count, end)
+        while pending:
+            future, count, end = pending.popleft()
+            yield future.result() + (count, end)
+
+
+def _feed_identity(path):
+    stat = os.stat(path)
+    return {"feed": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(checkpoint_path, path):
+    """The saved progress for this feed, or None. Refuses a checkpoint written for another feed."""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    identity = _feed_identity(path)
+    if any(state.get(key) != value for key, value in identity.items()):
+        raise CatalogError(
+            f"Checkpoint {checkpoint_path} belongs to a different or modified feed; pass --restart to import from the start"
+        )
+    return state
+
+
+def save_checkpoint(checkpoint_path, state):
+    """Write the checkpoint atomically, so a crash leaves the previous one intact."""
+    partial = checkpoint_path + '.tmp'
+    with open(partial, 'w') as f:
+        json.dump(state, f)
+    os.replace(partial, checkpoint_path)
+
+
+def import_catalog(path, fmt=None, chunk_size=None, workers=None, checkpoint_path=None,
+                   restart=False, rejects_path=None, cluster=False, progress=None):
+    """
+    Stream a CSV or NDJSON product feed into the catalog.
+
+    Records are validated in `workers` processes (0 validates in-process; by default
+    one per CPU beyond the first) and each chunk is upserted and committed in its own
+    transaction. After every commit the feed offset is checkpointed, so an
+    interrupted import resumes after the last committed chunk. Rejected records are counted and, with `rejects_path`, written
+    out as NDJSON. Cluster assignment is skipped unless `cluster` is set; run
+    `flask cluster-products` afterwards instead. Returns the import summary.
+    """
+    fmt = detect_format(path, fmt)
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    if workers is None:  # The main process parses and commits; validation gets the other cores
+        workers = max((os.cpu_count() or 1) - 1, 0)
+    checkpoint_path = checkpoint_path or path + '.checkpoint'
+
+    state = None if restart else load_checkpoint(checkpoint_path, path)
+    if state is None:
+        state = dict(_feed_identity(path), offset=0, records=0, imported=0, rejected=0)
+    stats = {"resumed_at": state["records"], "errors": [], "elapsed": 0.0}
+
+    start = time.perf_counter()
+    rejects = open(rejects_path, 'a' if state["records"] else 'w') if rejects_path else None
+    try:
+        chunks = read_chunks(read_feed(path, fmt, state["offset"]), chunk_size)
+        for rows, errors, count, offset in validated_chunks(chunks, workers):
+            if rows:
+                upsert_products(rows, cluster=cluster)
+
+            for position, reason in errors:
+                record = state["records"] + position + 1
+                if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+                    stats["errors"].append({"record": record, "error": reason})
+                if rejects:
+                    rejects.write(json.dumps({"record": record, "error": reason}) + '\n')
+            state.update(
+                offset=offset,
+                records=state["records"] + count,
+                imported=state["imported"] + len(rows),
+                rejected=state["rejected"] + len(errors),
+            )
+            if rejects:
+                rejects.flush()
+            save_checkpoint(checkpoint_path, state)
+            if progress:
+                progress(dict(state, elapsed=time.perf_counter() - start))
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        if rejects:
+            rejects.close()
+
+    # Finished: a rerun starts over rather than resuming
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    # Match the imported price drops now; the alert worker thread dies with the CLI process
+    while alert_engine.process_pending():
+        pass
+
+    stats.update(
+        records=state["records"],
+        imported=state["imported"],
+        rejected=state["rejected"],
+        elapsed=time.perf_counter() - start,
+    )
+    return stats
+
+
+def export_catalog(out, fmt, shop=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream products to a text file object as CSV or NDJSON, in the import format.
+
+    Rows are read in id order one keyset page at a time, so memory stays flat
+    whatever the catalog size. Returns the number of products written.
+    """
+    stmt = select(Product.id, *[getattr(Product, column) for column in PRODUCT_COLUMNS]).order_by(Product.id)
+    if shop:
+        stmt = stmt.where(Product.shop_name == shop)
+
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(PRODUCT_COLUMNS)
+
+    last_id, written = 0, 0
+    while True:
+        rows = db.session.execute(stmt.where(Product.id > last_id).limit(batch_size)).all()
+        if not rows:
+            return written
+        for row in rows:
+            if writer:
+                writer.writerow(row[1:])
+            else:
+                out.write(json.dumps(dict(zip(PRODUCT_COLUMNS, row[1:])), ensure_ascii=False) + '\n')
+        last_id = rows[-1][0]
+        written += len(rows)
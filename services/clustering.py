@@ -0,0 +1,321 @@
+import hashlib
+import os
+import re
+import struct
+from collections import Counter
+from functools import lru_cache
+
+from sqlalchemy import delete, exists, func, insert, select, update
+
+from model import Product, ProductBucket, ProductCluster, db
+from services.fulltext import tokenize
+
+# MinHash signature length = bands x rows; candidates must agree on every row of some band.
+# 16 bands of 4 rows catch pairs with a shingle Jaccard of roughly 0.5 and above.
+LSH_BANDS = 16
+LSH_ROWS = 4
+
+# Shingle Jaccard similarity two listings need to be treated as the same product
+MATCH_THRESHOLD = float(os.getenv("CLUSTER_MATCH_THRESHOLD", "0.6"))
+
+# Listings priced further apart than this factor are never merged
+MAX_PRICE_RATIO = float(os.getenv("CLUSTER_MAX_PRICE_RATIO", "2.5"))
+
+# Set to 0 to skip clustering during ingest (run `flask cluster-products` instead)
+CLUSTER_ON_INGEST = os.getenv("CLUSTER_ON_INGEST", "1") != "0"
+
+# Bucket values per candidate lookup query
+BUCKET_LOOKUP_CHUNK = 5000
+
+# Candidates compared per product, most shared bands first (bounds work on very common titles)
+MAX_CANDIDATES = 50
+
+# Buckets with more members than this are skipped when looking up candidates: a band that
+# thousands of titles share says little, and loading them would scan the catalog per batch
+MAX_BUCKET_MEMBERS = int(os.getenv("CLUSTER_MAX_BUCKET_MEMBERS", "200"))
+
+# Words that shops add to titles without changing what the product is
+NOISE_WORDS = {
+    'new', 'original', 'genuine', 'brand', 'official', 'sale', 'offer', 'free', 'shipping',
+    'with', 'and', 'for', 'the', 'of', 'in', 'by', 'plus', 'edition', 'version', 'smartphone',
+}
+
+DIGIT_RE = re.compile(r'\d')
+
+# One 32-bit hash per signature position, all cut from a single SHAKE digest of the shingle
+_SHINGLE_HASHES = struct.Struct(f'<{LSH_BANDS * LSH_ROWS}I')
+
+# Band index plus that band's rows, hashed into the band's bucket key
+_BAND_ROWS = struct.Struct(f'<B{LSH_ROWS}I')
+
+
+def normalize_name(name):
+    """Lowercased title tokens without punctuation and marketing noise."""
+    return [token for token in tokenize(name) if token not in NOISE_WORDS]
+
+
+class Fingerprint:
+    """Shingles and model-number tokens of a product title."""
+
+    __slots__ = ('shingles', 'model_tokens')
+
+    def __init__(self, name):
+        tokens = normalize_name(name)
+        text = ' '.join(tokens)
+        self.shingles = {text[i:i + 3] for i in range(len(text) - 2)} or {text}
+        # Tokens with digits (model numbers, capacities) must agree exactly: "a51" is not "a52"
+        self.model_tokens = frozenset(token for token in tokens if DIGIT_RE.search(token))
+
+    def similarity(self, other):
+        if self.model_tokens != other.model_tokens:
+            return 0.0
+        union = len(self.shingles | other.shingles)
+        return len(self.shingles & other.shingles) / union if union else 0.0
+
+
+@lru_cache(maxsize=65536)
+def fingerprint(name):
+    return Fingerprint(name)
+
+
+@lru_cache(maxsize=65536)
+def _shingle_hashes(shingle):
+    return _SHINGLE_HASHES.unpack(hashlib.shake_128(shingle.encode()).digest(_SHINGLE_HASHES.size))
+
+
+def minhash(shingles):
+    """MinHash signature of a shingle set; stable across processes, unlike hash()."""
+    return list(map(min, zip(*map(_shingle_hashes, shingles))))
+
+
+def band_buckets(signature, model_tokens=frozenset()):
+    """
+    One 63-bit bucket key per LSH band. The band index is mixed in so bands never
+    collide, and so are the model tokens: listings whose model numbers differ can never
+    match, so they need not share buckets ("phone 12" and "phone 13" stay apart).
+    """
+    salt = ' '.join(sorted(model_tokens)).encode()
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(_BAND_ROWS.pack(band, *rows) + salt, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big') >> 1)
+    return buckets
+
+
+def is_match(first, second):
+    """Whether two (Fingerprint, price) listings are the same product."""
+    (fingerprint, price), (other_fingerprint, other_price) = first, second
+    if price and other_price and max(price, other_price) > MAX_PRICE_RATIO * min(price, other_price):
+        return False
+    return fingerprint.similarity(other_fingerprint) >= MATCH_THRESHOLD
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, first, second):
+        self.parent[self.find(first)] = self.find(second)
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return groups.values()
+
+
+def _candidates(buckets):
+    """
+    Map each bucket to the ids of products in it, with (name, price, cluster_id) per
+    product. Buckets above MAX_BUCKET_MEMBERS are left out.
+    """
+    members, listings = {}, {}
+    buckets = list(buckets)
+    for start in range(0, len(buckets), BUCKET_LOOKUP_CHUNK):
+        chunk = buckets[start:start + BUCKET_LOOKUP_CHUNK]
+        # Member counts come from the (bucket, product_id) index alone
+        sizes = select(ProductBucket.bucket).where(ProductBucket.bucket.in_(chunk)).group_by(ProductBucket.bucket)
+        usable = db.session.execute(
+            sizes.having(func.count() <= MAX_BUCKET_MEMBERS)
+        ).scalars().all()
+        if not usable:
+            continue
+        query = (
+            select(ProductBucket.bucket, Product.id, Product.product_name, Product.product_price, Product.cluster_id)
+            .join(Product, Product.id == ProductBucket.product_id)
+            .where(ProductBucket.bucket.in_(usable))
+        )
+        for bucket, product_id, name, price, cluster_id in db.session.execute(query):
+            members.setdefault(bucket, set()).add(product_id)
+            listings[product_id] = (name, price, cluster_id)
+    return members, listings
+
+
+def assign_clusters(product_ids):
+    """
+    Put new or renamed products into clusters. Does not commit.
+
+    Each product's MinHash band buckets are stored, products sharing a bucket are
+    compared, and matches join (or merge) existing clusters. Products without a
+    match start a cluster of their own. Returns the number of products assigned.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return 0
+
+    query = select(Product.id, Product.product_name, Product.product_price, Product.cluster_id).where(
+        Product.id.in_(product_ids)
+    )
+    batch = {product_id: (name, price, cluster_id) for product_id, name, price, cluster_id in db.session.execute(query)}
+
+    listings = {product_id: (fingerprint(name), price) for product_id, (name, price, _) in batch.items()}
+    buckets = {
+        product_id: band_buckets(minhash(listings[product_id][0].shingles), listings[product_id][0].model_tokens)
+        for product_id in batch
+    }
+
+    # Look up products already stored under these buckets (the batch's own rows are gone
+    # or not written yet), then add the batch's members from memory
+    db.session.execute(delete(ProductBucket).where(ProductBucket.product_id.in_(list(batch))))
+    members, candidates = _candidates({bucket for keys in buckets.values() for bucket in keys})
+    for product_id, keys in buckets.items():
+        for bucket in keys:
+            members.setdefault(bucket, set()).add(product_id)
+    for bucket in [bucket for bucket, ids in members.items() if len(ids) > MAX_BUCKET_MEMBERS]:
+        del members[bucket]
+
+    # Store the new buckets so renamed products are found under their new name.
+    # Core insert: these rows never need ORM identities, and there are LSH_BANDS per product
+    db.session.execute(insert(ProductBucket.__table__), [
+        {"product_id": product_id, "band": band, "bucket": bucket}
+        for product_id, keys in buckets.items()
+        for band, bucket in enumerate(keys)
+    ])
+
+    clusters = _UnionFind()
+    for product_id, keys in buckets.items():
+        clusters.find(product_id)
+        shared = Counter()
+        for bucket in keys:
+            shared.update(members.get(bucket, ()))
+        for other_id, _ in shared.most_common(MAX_CANDIDATES + 1):
+            if other_id == product_id or clusters.find(other_id) == clusters.find(product_id):
+                continue
+            if other_id not in listings:
+                name, price, _ = candidates[other_id]
+                listings[other_id] = (fingerprint(name), price)
+            if is_match(listings[product_id], listings[other_id]):
+                clusters.union(product_id, other_id)
+
+    assignments, new_clusters = {}, []
+    for group in clusters.groups():
+        # Only products outside this batch vouch for a cluster; batch products are being (re)assigned
+        existing = Counter(candidates[p][2] for p in group if p not in batch and candidates[p][2] is not None)
+        if existing:
+            cluster_id, _ = existing.most_common(1)[0]
+            merged = [other for other in existing if other != cluster_id]
+            if merged:
+                db.session.execute(
+                    update(Product).where(Product.cluster_id.in_(merged)).values(cluster_id=cluster_id)
+                )
+                db.session.execute(delete(ProductCluster).where(ProductCluster.id.in_(merged)))
+        else:
+            names = [batch[p][0] if p in batch else candidates[p][0] for p in group]
+            new_clusters.append((group, min(names, key=len)))
+            continue
+        for product_id in group:
+            if product_id in batch:
+                assignments[product_id] = cluster_id
+
+    if new_clusters:
+        stmt = insert(ProductCluster).returning(ProductCluster.id, sort_by_parameter_order=True)
+        result = db.session.execute(stmt, [{"canonical_name": name[:255]} for _, name in new_clusters])
+        for (group, _), cluster_id in zip(new_clusters, result.scalars()):
+            for product_id in group:
+                assignments[product_id] = cluster_id
+
+    changed = [
+        {"id": product_id, "cluster_id": cluster_id}
+        for product_id, cluster_id in assignments.items()
+        if batch[product_id][2] != cluster_id
+    ]
+    if changed:
+        db.session.execute(update(Product), changed)
+
+    # Drop clusters that renamed products left empty
+    previous = {cluster_id for _, _, cluster_id in batch.values() if cluster_id is not None}
+    if previous - set(assignments.values()):
+        db.session.execute(
+            delete(ProductCluster).where(
+                ProductCluster.id.in_(previous - set(assignments.values())),
+                ~exists().where(Product.cluster_id == ProductCluster.id),
+            )
+        )
+    return len(assignments)
+
+
+def rebuild_clusters(batch_size=500):
+    """Recluster the whole catalog from scratch, committing after every batch. Returns the cluster count."""
+    db.session.execute(update(Product).values(cluster_id=None))
+    db.session.execute(delete(ProductBucket))
+    db.session.execute(delete(ProductCluster))
+    db.session.commit()
+
+    last_id = 0
+    while True:
+        ids = db.session.execute(
+            select(Product.id).where(Product.id > last_id).order_by(Product.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        assign_clusters(ids)
+        db.session.commit()
+        last_id = ids[-1]
+
+    return db.session.query(ProductCluster).count()
+
+
+def group_by_cluster(results, limit=None):
+    """
+    Group ranked search results into one entry per cluster with its per-shop offers.
+    Clusters are ranked as units by their best-ranked offer, and the first `limit`
+    clusters are returned; pass every ranked offer so clusters are complete.
+    """
+    product_ids = [result['product_id'] for result in results if result.get('product_id') is not None]
+    clusters = {}
+    if product_ids:
+        query = (
+            select(Product.id, ProductCluster.id, ProductCluster.canonical_name)
+            .join(ProductCluster, ProductCluster.id == Product.cluster_id)
+            .where(Product.id.in_(product_ids))
+        )
+        clusters = {product_id: (cluster_id, name) for product_id, cluster_id, name in db.session.execute(query)}
+
+    groups = {}
+    for result in results:
+        cluster_id, name = clusters.get(result.get('product_id'), (None, result['product_name']))
+        key = cluster_id if cluster_id is not None else ('product', result.get('product_id'), len(groups))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "cluster_id": cluster_id,
+                "product_name": name,
+                "mb_score": result['mb_score'],
+                "best_price": result['product_price'],
+                "offers": [],
+            }
+        group['best_price'] = min(group['best_price'], result['product_price'])
+        group['offers'].append(result)
+
+    ranked = list(groups.values())[:limit]
+    for rank, group in enumerate(ranked, start=1):
+        group['rank'] = rank
+        group['shops'] = len({offer['shop_name'] for offer in group['offers']})
+    return ranked
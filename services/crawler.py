@@ -0,0 +1,207 @@
+import os
+import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Default time (in seconds) a single shop is given to answer before we give up on it
+DEFAULT_SHOP_TIMEOUT = float(os.getenv("CRAWL_SHOP_TIMEOUT", "2.0"))
+
+# Upper bound on the number of shops crawled at the same time across all requests
+MAX_CRAWL_WORKERS = int(os.getenv("CRAWL_MAX_WORKERS", "16"))
+
+# Fetches of one shop in flight at once; beyond this the shop is skipped for the crawl,
+# so a shop that hangs can hold at most this many crawl workers
+MAX_CRAWLS_PER_SHOP = int(os.getenv("CRAWL_MAX_PER_SHOP", "3"))
+
+
+class ShopBusy(Exception):
+    """Raised when a shop already has MAX_CRAWLS_PER_SHOP fetches in flight."""
+
+
+class ShopAdapter:
+    """
+    Base class for a single e-commerce shop. Subclasses implement fetch().
+    """
+    name = None
+
+    def __init__(self, name=None, timeout=None, max_in_flight=MAX_CRAWLS_PER_SHOP):
+        if name:
+            self.name = name
+        self.timeout = timeout if timeout is not None else DEFAULT_SHOP_TIMEOUT
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def fetch(self, query, timeout=None):
+        """
+        Return a list of product dicts for the given query. `timeout` is the time left
+        (seconds) before the crawl gives up on this shop; network calls should not
+        outlive it, since the worker thread stays busy until fetch returns.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'<ShopAdapter {self.name}>'
+
+
+class StaticShopAdapter(ShopAdapter):
+    """
+    Shop adapter that serves a fixed list of listings (used for the simulated crawl).
+    """
+
+    def __init__(self, name, listings, timeout=None):
+        super().__init__(name, timeout)
+        self.listings = listings
+
+    def fetch(self, query, timeout=None):
+        return [dict(listing, shop_name=self.name) for listing in self.listings]
+
+
+class FakeShopAdapter(ShopAdapter):
+    """
+    Local fake shop with configurable latency, for load and latency testing.
+    """
+
+    def __init__(self, name, latency=0.0, jitter=0.0, num_results=5, failure_rate=0.0, timeout=None, seed=None):
+        super().__init__(name, timeout)
+        self.latency = latency
+        self.jitter = jitter
+        self.num_results = num_results
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def fetch(self, query, timeout=None):
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0))  # Like a client-side request timeout
+            raise TimeoutError(f"{self.name} did not answer within {timeout:.2f}s")
+        if delay:
+            time.sleep(delay)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.name} is unavailable")
+
+        slug = '-'.join(query.lower().split())
+        return [
+            {
+                "product_name": f"{query} #{i}",
+                "product_price": round(self._random.uniform(1000, 50000), 2),
+                "product_rating": round(self._random.uniform(1, 5), 1),
+                "num_ratings": self._random.randint(0, 500),
+                "delivery_cost": float(self._random.choice([0, 100, 150, 200, 350])),
+                "payment_mode": self._random.choice(["Pay before delivery", "Pay after delivery"]),
+                "shop_name": self.name,
+                "product_url": f"https://{self.name.lower().replace(' ', '')}.example/{slug}-{i}",
+            }
+            for i in range(self.num_results)
+        ]
+
+
+class CrawlResult:
+    """
+    Outcome of a crawl: the merged products plus which shops answered in time.
+    """
+
+    def __init__(self):
+        self.products = []
+        self.completed = []
+        self.timed_out = []
+        self.failed = {}
+        self.elapsed = 0.0
+
+    @property
+    def partial(self):
+        return bool(self.timed_out or self.failed)
+
+
+# Simulated crawl of the shops we currently support
+SHOP_ADAPTERS = [
+    StaticShopAdapter("Jumia", [
+        {"product_name": "Samsung A51", "product_price": 30098, "product_rating": 4.7, "num_ratings": 10, "delivery_cost": 200, "payment_mode": "Pay after delivery", "product_url": "https://jumia.com/samsung-a51"},
+    ]),
+    StaticShopAdapter("Kill Mall", [
+        {"product_name": "Samsung A51", "product_price": 29999, "product_rating": 4.0, "num_ratings": 4, "delivery_cost": 150, "payment_mode": "Pay before delivery", "product_url": "https://killmall.com/samsung-a51"},
+    ]),
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def register_adapter(adapter):
+    """Add a shop adapter to the default crawl."""
+    SHOP_ADAPTERS.append(adapter)
+    return adapter
+
+
+def get_executor():
+    """Return the shared, bounded thread pool used for crawling."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_CRAWL_WORKERS, thread_name_prefix='crawl')
+    return _executor
+
+
+def _fetch(adapter, query, deadline):
+    """Run one shop's fetch on a crawl worker with the time left until its deadline."""
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"{adapter.name} was not reached before its deadline")
+        return adapter.fetch(query, timeout=remaining)
+    finally:
+        adapter.in_flight.release()
+
+
+def _submit(executor, adapter, query, deadline):
+    if not adapter.in_flight.acquire(blocking=False):
+        raise ShopBusy(f"{adapter.name} already has too many crawls in flight")
+    try:
+        return executor.submit(_fetch, adapter, query, deadline)
+    except Exception:
+        adapter.in_flight.release()
+        raise
+
+
+def crawl_shops(query, adapters=None, executor=None):
+    """
+    Fan the query out to every shop in parallel and merge whatever comes back in time.
+
+    Each shop gets its own deadline (adapter.timeout) measured from the start of the
+    crawl, so the total wait is bounded by the largest timeout and a slow shop never
+    delays the results of the others. The time left is passed to the shop's fetch so
+    its own calls give up too, and each shop holds at most MAX_CRAWLS_PER_SHOP crawl
+    workers, so a hanging shop cannot starve the others of the shared pool. Shops
+    that miss their deadline, are busy or raise are reported on the result instead
+    of failing the whole crawl.
+    """
+    adapters = SHOP_ADAPTERS if adapters is None else adapters
+    executor = executor or get_executor()
+    result = CrawlResult()
+
+    start = time.monotonic()
+    futures = []
+    for adapter in adapters:
+        try:
+            futures.append((adapter, _submit(executor, adapter, query, start + adapter.timeout)))
+        except ShopBusy as e:
+            result.failed[adapter.name] = str(e)
+
+    # Collect in deadline order so we never wait longer than each shop's own budget
+    for adapter, future in sorted(futures, key=lambda item: item[0].timeout):
+        remaining = adapter.timeout - (time.monotonic() - start)
+        try:
+            products = future.result(timeout=max(remaining, 0))
+        except (FutureTimeoutError, TimeoutError):
+            future.cancel()  # Only succeeds if the shop has not started yet
+            result.timed_out.append(adapter.name)
+            continue
+        except Exception as e:
+            result.failed[adapter.name] = str(e)
+            continue
+
+        result.products.extend(products)
+        result.completed.append(adapter.name)
+
+    result.elapsed = time.monotonic() - start
+    return result
@@ -0,0 +1,133 @@
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from model import db
+
+# Deployment profile: 'sqlite' or 'postgresql'; inferred from the database URL when unset
+DB_PROFILE = os.getenv("DB_PROFILE")
+
+# Compiled-statement cache entries per engine (SQLAlchemy's default is 500)
+QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
+
+# SQLite: wait this long for a lock instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# PostgreSQL pool sizing: keep DB_POOL_SIZE connections open per process and allow
+# DB_MAX_OVERFLOW more under bursts; recycle connections before server/proxy idle limits
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+
+def detect_profile(uri):
+    backend = make_url(uri).get_backend_name()
+    return 'postgresql' if backend == 'postgresql' else backend
+
+
+def engine_options(profile):
+    """SQLALCHEMY_ENGINE_OPTIONS for a deployment profile."""
+    options = {"query_cache_size": QUERY_CACHE_SIZE}
+    if profile == 'sqlite':
+        # pysqlite's own busy handler, in seconds; the PRAGMA below covers other drivers
+        options["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    elif profile == 'postgresql':
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            # Reuse the most recently returned connection so idle extras age out and get recycled
+            pool_use_lifo=True,
+        )
+    return options
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # Readers no longer block the writer
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+class PoolMetrics:
+    """Connection pool event counters for one engine."""
+
+    def __init__(self, engine, profile):
+        self.engine = engine
+        self.profile = profile
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'connect', self._count('connects'))
+        event.listen(engine, 'checkout', self._count('checkouts'))
+        event.listen(engine, 'checkin', self._count('checkins'))
+        event.listen(engine, 'invalidate', self._count('invalidations'))
+
+    def _count(self, name):
+        def listener(*args):
+            with self._lock:
+                setattr(self, name, getattr(self, name) + 1)
+        return listener
+
+    def snapshot(self):
+        pool = self.engine.pool
+        stats = {
+            "profile": self.profile,
+            "pool": type(pool).__name__,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "invalidations": self.invalidations,
+        }
+        # Only QueuePool-style pools report sizes
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if callable(method):
+                stats[name] = method()
+        return stats
+
+
+def init_database(app, profile=None):
+    """
+    Apply the engine profile for the app's database and initialize Flask-SQLAlchemy.
+
+    Options already set in SQLALCHEMY_ENGINE_OPTIONS take precedence. SQLite
+    connections get WAL / busy_timeout / synchronous pragmas, and every engine
+    (including binds) gets pool metrics, available through pool_stats().
+    """
+    profile = profile or DB_PROFILE or detect_profile(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = engine_options(profile)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    db.init_app(app)
+
+    metrics = {}
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            engine_profile = detect_profile(engine.url)
+            if engine_profile == 'sqlite':
+                event.listen(engine, 'connect', _sqlite_pragmas)
+            metrics[bind or 'default'] = PoolMetrics(engine, engine_profile)
+    app.extensions['db_pool_metrics'] = metrics
+    return metrics
+
+
+def pool_stats(app):
+    """Pool metrics for every engine of an app set up with init_database()."""
+    return {bind: metrics.snapshot() for bind, metrics in app.extensions.get('db_pool_metrics', {}).items()}
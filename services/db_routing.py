@@ -0,0 +1,392 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+
+# SQLALCHEMY_BINDS entries named replica* serve the reads of @read_only endpoints
+REPLICA_BIND_PREFIX = 'replica'
+
+# After a client writes, its reads stay on the primary this long (seconds) to cover replica lag.
+# Signed-in clients are pinned by JWT subject on the server; anonymous ones by a cookie.
+STICKY_PRIMARY_SECONDS = float(os.getenv("DB_STICKY_PRIMARY_SECONDS", "5"))
+STICKY_COOKIE = 'db_primary_until'
+
+# Share pins between workers through Redis when set (the redis package is imported lazily)
+STICKY_REDIS_URL = os.getenv("DB_STICKY_REDIS_URL", os.getenv("RATE_LIMIT_REDIS_URL"))
+
+# Pinned subjects tracked in-process; the least recently pinned are dropped beyond this
+MAX_PINNED_SUBJECTS = 100000
+
+# Replicas are probed at most this often (seconds); a failed one is skipped for REPLICA_RETRY_SECONDS
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+
+# PostgreSQL replicas further behind than this (seconds) are treated as unhealthy
+MAX_REPLICA_LAG = float(os.getenv("DB_MAX_REPLICA_LAG", "10"))
+
+# Connect timeout (seconds) for PostgreSQL replicas, so an unreachable one fails fast
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+
+PG_REPLICA_LAG = text(
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+)
+
+
+class Replica:
+    """Health and counters for one replica bind."""
+
+    __slots__ = ('bind', 'engine', 'down_until', 'checked_at', 'lag', 'reads', 'failures', 'last_error')
+
+    def __init__(self, bind, engine):
+        self.bind = bind
+        self.engine = engine
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.lag = None
+        self.reads = 0
+        self.failures = 0
+        self.last_error = None
+
+
+class ReplicaSet:
+    """
+    The replica binds of one app.
+
+    Replicas are chosen round robin among the healthy ones. A replica is marked down
+    when one of its connections fails (see the handle_error listener) or when a probe
+    finds it unreachable or lagging, and is probed again after REPLICA_RETRY_SECONDS.
+    Probes run on a background thread, started with the first choice, so a replica
+    that stops answering never stalls a request's routing decision.
+    """
+
+    def __init__(self, engines):
+        self.replicas = [Replica(bind, engine) for bind, engine in sorted(engines.items())]
+        self._by_bind = {replica.bind: replica for replica in self.replicas}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self.primary_reads = 0
+        self.failovers = 0
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', self._on_error(replica))
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def engine(self, bind):
+        return self._by_bind[bind].engine
+
+    def _on_error(self, replica):
+        def listener(context):
+            if isinstance(context.sqlalchemy_exception, (OperationalError, InterfaceError)) or context.is_disconnect:
+                self.mark_down(replica.bind, context.original_exception)
+        return listener
+
+    def is_down(self, bind):
+        return self._by_bind[bind].down_until > time.monotonic()
+
+    def mark_down(self, bind, error=None):
+        replica = self._by_bind[bind]
+        with self._lock:
+            replica.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+            replica.failures += 1
+            replica.last_error = str(error) if error is not None else replica.last_error
+
+    def _probe(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                if replica.engine.dialect.name == 'postgresql':
+                    replica.lag = float(connection.execute(PG_REPLICA_LAG).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    replica.lag = None
+        except Exception as exc:
+            self.mark_down(replica.bind, exc)
+            return
+        if replica.lag is not None and replica.lag > MAX_REPLICA_LAG:
+            self.mark_down(replica.bind, f"replication lag {replica.lag:.1f}s")
+
+    def probe_due(self):
+        """Probe every replica that is not waiting out REPLICA_RETRY_SECONDS."""
+        now = time.monotonic()
+        for replica in self.replicas:
+            if replica.down_until <= now:
+                replica.checked_at = now
+                self._probe(replica)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='replica-probe', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.probe_due()
+            if self._stopped.wait(REPLICA_CHECK_INTERVAL):
+                break
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def choose(self):
+        """Bind name of a healthy replica, or None to read from the primary."""
+        self._ensure_started()
+        now = time.monotonic()
+        start = next(self._counter)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.down_until <= now:
+                replica.reads += 1
+                return replica.bind
+        self.primary_reads += 1
+        return None
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            "replicas": {
+                replica.bind: {
+                    "healthy": replica.down_until <= now,
+                    "retry_in": round(max(replica.down_until - now, 0), 1),
+                    "lag": replica.lag,
+                    "reads": replica.reads,
+                    "failures": replica.failures,
+                    "last_error": replica.last_error,
+                }
+                for replica in self.replicas
+            },
+            "primary_reads": self.primary_reads,
+            "failovers": self.failovers,
+            "sticky_seconds": STICKY_PRIMARY_SECONDS,
+        }
+
+
+def _replica_engine():
+    """The replica engine this request reads from, or None."""
+    if not has_request_context():
+        return None
+    bind = g.get('db_replica')
+    if bind is None or g.get('db_wrote'):
+        return None
+    return current_app.extensions['db_replicas'].engine(bind)
+
+
+class RoutingSession(Session):
+    """
+    db.session for apps with replica binds.
+
+    Inside a @read_only request, reads of the primary's tables go to the replica
+    chosen for the request. Flushes and INSERT/UPDATE/DELETE statements always go to
+    the primary, and once the request has written, its later reads do too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or isinstance(clause, UpdateBase):
+            return engine
+        replica = _replica_engine()
+        if replica is not None and engine is self._db.engine:
+            return replica
+        return engine
+
+
+def stick_to_primary():
+    """
+    Note that this request wrote (or queued a write), so the client's reads stay on
+    the primary for STICKY_PRIMARY_SECONDS. Session writes are noted automatically.
+    """
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        stick_to_primary()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush_write(session, flush_context):
+    stick_to_primary()
+
+
+class PrimaryPins:
+    """
+    JWT subjects pinned to the primary until a deadline. Kept in Redis when
+    configured, so every worker sees them; in-process otherwise, or while Redis is
+    unreachable.
+    """
+
+    def __init__(self, redis_url=STICKY_REDIS_URL, max_subjects=MAX_PINNED_SUBJECTS, prefix='dbpin:'):
+        self.redis_url = redis_url
+        self.max_subjects = max_subjects
+        self.prefix = prefix
+        self._pins = OrderedDict()  # subject -> monotonic deadline
+        self._lock = threading.Lock()
+        self._client = None
+        self._errors = ()
+
+    def _redis(self):
+        if self._client is None and self.redis_url:
+            with self._lock:
+                if self._client is None:
+                    import redis
+                    self._client = redis.Redis.from_url(self.redis_url, socket_timeout=0.1, socket_connect_timeout=0.1)
+                    self._errors = redis.RedisError
+        return self._client
+
+    def pin(self, subject, seconds=STICKY_PRIMARY_SECONDS):
+        with self._lock:
+            self._pins.pop(subject, None)
+            self._pins[subject] = time.monotonic() + seconds
+            while len(self._pins) > self.max_subjects:
+                self._pins.popitem(last=False)
+        client = self._redis()
+        if client is not None:
+            try:
+                client.set(self.prefix + str(subject), 1, px=int(seconds * 1000))
+            except self._errors:
+                current_app.logger.warning("Primary pin store unreachable; pinning %s in-process only", subject)
+
+    def is_pinned(self, subject):
+        deadline = self._pins.get(subject)
+        if deadline is not None and deadline > time.monotonic():
+            return True
+        client = self._redis()
+        if client is None:
+            return False
+        try:
+            return bool(client.exists(self.prefix + str(subject)))
+        except self._errors:
+            return False
+
+
+primary_pins = PrimaryPins()
+
+
+def client_subject():
+    """JWT subject of the current request, or None for anonymous clients."""
+    if 'db_subject' not in g:
+        from services.auth_cache import bearer_token, token_cache  # auth_cache imports model, which imports us
+        claims = token_cache.verify(bearer_token(request.headers.get('Authorization')))
+        g.db_subject = claims.get('sub') if claims else None
+    return g.db_subject
+
+
+def primary_pinned():
+    """Whether this client wrote recently enough that it must read from the primary."""
+    subject = client_subject()
+    if subject is not None:
+        return primary_pins.is_pinned(subject)
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_only(view):
+    """
+    Serve a view's reads from a replica, unless the client wrote within the sticky
+    window. If the replica's connection fails mid-request, the view is run again on
+    the primary; read-only views are safe to repeat.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = current_app.extensions.get('db_replicas')
+        if not replicas or primary_pinned():
+            return view(*args, **kwargs)
+
+        g.db_replica = replicas.choose()
+        if g.db_replica is None:
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        except (OperationalError, InterfaceError):
+            if not replicas.is_down(g.db_replica):  # The primary failed, not the replica
+                raise
+            g.db_replica = None
+            replicas.failovers += 1
+            current_app.extensions['sqlalchemy'].session.rollback()
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def _pin_writer(response):
+    if not g.get('db_wrote'):
+        return response
+    subject = client_subject()
+    if subject is not None:
+        primary_pins.pin(subject)
+    else:
+        response.set_cookie(
+            STICKY_COOKIE, f"{time.time() + STICKY_PRIMARY_SECONDS:.3f}",
+            max_age=int(STICKY_PRIMARY_SECONDS) + 1, httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def init_replicas(app):
+    """
+    Set up read routing for the replica binds in SQLALCHEMY_BINDS. Requires db to use
+    RoutingSession; without replica binds every read stays on the primary.
+    """
+    db = app.extensions['sqlalchemy']
+    with app.app_context():
+        engines = {bind: engine for bind, engine in db.engines.items() if bind and bind.startswith(REPLICA_BIND_PREFIX)}
+    replicas = app.extensions['db_replicas'] = ReplicaSet(engines)
+    if replicas:
+        app.after_request(_pin_writer)
+    return replicas
+
+
+def sync_sqlite_replicas(app):
+    """
+    Copy a SQLite primary into each SQLite replica with the online backup API, so
+    routing can be tried locally with two database files. Returns the binds copied.
+    """
+    db = app.extensions['sqlalchemy']
+    copied = []
+    with app.app_context():
+        primary = db.engine.raw_connection()
+        try:
+            for replica in app.extensions['db_replicas'].replicas:
+                if replica.engine.dialect.name != 'sqlite' or db.engine.dialect.name != 'sqlite':
+                    continue
+                target = replica.engine.raw_connection()
+                try:
+                    primary.driver_connection.backup(target.driver_connection)
+                finally:
+                    target.close()
+                copied.append(replica.bind)
+        finally:
+            primary.close()
+    return copied
+
+
+def replica_binds(urls):
+    """
+    SQLALCHEMY_BINDS entries for a comma-separated list of replica URLs. PostgreSQL
+    replicas get a short connect timeout.
+    """
+    binds = {}
+    for number, url in enumerate((url.strip() for url in (urls or '').split(',') if url.strip()), 1):
+        if url.startswith('postgres'):
+            url = {"url": url, "connect_args": {"connect_timeout": REPLICA_CONNECT_TIMEOUT}}
+        binds[f"{REPLICA_BIND_PREFIX}_{number}"] = url
+    return binds
@@ -0,0 +1,238 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+
+from sqlalchemy import select
+
+from model import Product, db
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Relative weight of each kind of token match
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.7
+FUZZY_WEIGHT = 0.5
+
+# Prefix and typo matching only kick in for query tokens at least this long
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+
+# Cap on the number of index tokens a single prefix may expand to
+MAX_PREFIX_EXPANSIONS = 50
+
+# Products added by other processes (workers, `flask catalog import`) are picked up by id
+# at most this often (seconds)...
+FULLTEXT_SYNC_INTERVAL = float(os.getenv("FULLTEXT_SYNC_INTERVAL", "5"))
+
+# ...and the whole index is rebuilt in the background this often, for renamed products
+FULLTEXT_REBUILD_INTERVAL = float(os.getenv("FULLTEXT_REBUILD_INTERVAL", "900"))
+
+
+def _products_query():
+    return select(Product.id, Product.product_name, Product.shop_name).execution_options(yield_per=5000)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def _deletes(token):
+    """The token plus every variant with one character removed (typo lookup keys)."""
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class ProductIndex:
+    """
+    In-process inverted index over product names and shop names.
+
+    Supports exact, prefix and one-typo matching (via a deletion-variant table) and
+    returns candidate ids ranked by idf-weighted token matches. It is loaded from the
+    database on first use and updated incrementally as this process ingests products.
+    Products ingested elsewhere are synced by id every FULLTEXT_SYNC_INTERVAL, and a
+    full rebuild every FULLTEXT_REBUILD_INTERVAL catches renames.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(set)  # token -> product ids
+        self._documents = {}  # product id -> (product_name, shop_name, tokens)
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._typos = defaultdict(set)  # deletion variant -> tokens
+        self._max_id = 0  # Highest product id indexed; sync() loads anything above it
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._synced_at = 0.0
+        self._rebuilt_at = 0.0
+        self._rebuilding = False
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _add_token(self, token, product_id):
+        postings = self._postings[token]
+        if not postings:
+            bisect.insort(self._vocabulary, token)
+            if len(token) >= MIN_FUZZY_LENGTH - 1:
+                for variant in _deletes(token):
+                    self._typos[variant].add(token)
+        postings.add(product_id)
+
+    def _remove_token(self, token, product_id):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.discard(product_id)
+        if not postings:
+            del self._postings[token]
+            del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+            for variant in _deletes(token):
+                tokens = self._typos.get(variant)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._typos[variant]
+
+    def add(self, product_id, product_name, shop_name=None):
+        """Index (or re-index) a single product."""
+        tokens = set(tokenize(product_name)) | set(tokenize(shop_name))
+        with self._lock:
+            previous = self._documents.get(product_id)
+            if previous is not None:
+                if previous[2] == tokens:
+                    self._documents[product_id] = (product_name, shop_name, tokens)
+                    return
+                for token in previous[2] - tokens:
+                    self._remove_token(token, product_id)
+            for token in tokens:
+                self._add_token(token, product_id)
+            self._documents[product_id] = (product_name, shop_name, tokens)
+            if product_id > self._max_id:
+                self._max_id = product_id
+
+    def add_many(self, rows):
+        """Index an iterable of (product_id, product_name, shop_name) rows."""
+        with self._lock:
+            for product_id, product_name, shop_name in rows:
+                self.add(product_id, product_name, shop_name)
+
+    def update(self, rows):
+        """Apply ingested rows to the index if it has been built; otherwise it loads them later."""
+        if self._loaded:
+            self.add_many(rows)
+
+    def remove(self, product_id):
+        with self._lock:
+            document = self._documents.pop(product_id, None)
+            if document is not None:
+                for token in document[2]:
+                    self._remove_token(token, product_id)
+
+    def ensure_loaded(self):
+        """
+        Build the index from the products table the first time it is needed; afterwards
+        sync or rebuild it when due.
+        """
+        if self._loaded:
+            now = time.monotonic()
+            if now - self._rebuilt_at >= FULLTEXT_REBUILD_INTERVAL:
+                self._start_rebuild()
+            elif now - self._synced_at >= FULLTEXT_SYNC_INTERVAL:
+                self.sync()
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.add_many(db.session.execute(_products_query()))
+            self._loaded = True
+            self._synced_at = self._rebuilt_at = time.monotonic()
+
+    def sync(self):
+        """Index products added since the last load or sync (one range scan on the primary key)."""
+        self._synced_at = time.monotonic()
+        self.add_many(db.session.execute(_products_query().where(Product.id > self._max_id)))
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._rebuilt_at = time.monotonic()
+        app = current_app._get_current_object()
+        threading.Thread(target=self._rebuild, args=(app,), name='fulltext-rebuild', daemon=True).start()
+
+    def _rebuild(self, app):
+        """Load a fresh index off to the side and swap it in; searches keep using the old one meanwhile."""
+        try:
+            fresh = ProductIndex()
+            with app.app_context():
+                fresh.add_many(db.session.execute(_products_query()))
+            with self._lock:
+                self._postings, self._documents = fresh._postings, fresh._documents
+                self._vocabulary, self._typos = fresh._vocabulary, fresh._typos
+                # Products indexed here during the load are re-read by the next sync
+                self._max_id = fresh._max_id
+                self._synced_at = 0.0
+        except Exception:
+            app.logger.exception("Rebuilding the product index failed")
+        finally:
+            self._rebuilding = False
+
+    def _expand(self, token):
+        """Yield (index token, weight) pairs matching a query token."""
+        if token in self._postings:
+            yield token, EXACT_WEIGHT
+
+        if len(token) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_left(self._vocabulary, token)
+            for candidate in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+                if not candidate.startswith(token):
+                    break
+                if candidate != token:
+                    yield candidate, PREFIX_WEIGHT
+
+        if len(token) >= MIN_FUZZY_LENGTH:
+            seen = {token}
+            for variant in _deletes(token):
+                for candidate in self._typos.get(variant, ()):
+                    if candidate not in seen:
+                        seen.add(candidate)
+                        yield candidate, FUZZY_WEIGHT
+
+    def search(self, query, limit=10):
+        """
+        Return up to `limit` (product_id, score) pairs for a query, best first.
+        Query tokens also match as prefixes, so partially typed words still hit.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = defaultdict(float)
+            for token in tokens:
+                best = {}
+                for candidate, weight in self._expand(token):
+                    postings = self._postings[candidate]
+                    score = weight * math.log(1 + total / len(postings))
+                    for product_id in postings:
+                        if score > best.get(product_id, 0.0):
+                            best[product_id] = score
+                for product_id, score in best.items():
+                    scores[product_id] += score
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def describe(self, product_id):
+        """Return (product_name, shop_name) for an indexed product."""
+        document = self._documents.get(product_id)
+        return (document[0], document[1]) if document else (None, None)
+
+
+product_index = ProductIndex()
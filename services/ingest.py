@@ -0,0 +1,142 @@
+import os
+from datetime import datetime
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from model import PriceHistory, Product, db
+from services.clustering import CLUSTER_ON_INGEST, assign_clusters
+from services.fulltext import product_index
+from services.price_alerts import alert_engine
+from services.product_cache import product_summaries
+
+# Rows per INSERT ... ON CONFLICT statement (keeps us under SQLite's bound-parameter limit)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+# Columns that identify a listing; must match uq_products_shop_url
+PRODUCT_KEY = ('shop_name', 'product_url')
+
+# Columns written on ingest and refreshed when the listing already exists
+PRODUCT_COLUMNS = (
+    'product_name',
+    'product_price',
+    'product_rating',
+    'num_ratings',
+    'product_url',
+    'delivery_cost',
+    'shop_name',
+    'payment_mode',
+)
+UPDATE_COLUMNS = tuple(c for c in PRODUCT_COLUMNS if c not in PRODUCT_KEY)
+
+
+def insert_for(model):
+    """Return a dialect-specific INSERT for the model so ON CONFLICT can be used."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
+
+
+def product_key(product):
+    return product['shop_name'], product['product_url']
+
+
+def _product_row(product):
+    row = {column: product.get(column) for column in PRODUCT_COLUMNS}
+    if row['num_ratings'] is None:
+        row['num_ratings'] = 0
+    return row
+
+
+def _current_listings(rows):
+    """Fetch the stored (id, price, name) of the listings in a batch, keyed by listing key."""
+    urls_by_shop = {}
+    for row in rows:
+        urls_by_shop.setdefault(row['shop_name'], []).append(row['product_url'])
+    # One "shop = ? AND url IN (...)" term per shop: each is an index search, whereas SQLite
+    # answers a row-value (shop, url) IN (...) by scanning the whole unique index
+    query = select(
+        Product.shop_name, Product.product_url, Product.id, Product.product_price, Product.product_name
+    ).where(or_(*[
+        and_(Product.shop_name == shop_name, Product.product_url.in_(urls))
+        for shop_name, urls in urls_by_shop.items()
+    ]))
+    return {(shop_name, url): (product_id, price, name) for shop_name, url, product_id, price, name in db.session.execute(query)}
+
+
+def _record_price_changes(rows, old_listings):
+    """
+    Append a PriceHistory row for every listing whose price actually changed.
+    Returns the changes as (product_id, product_name, old_price, new_price).
+    """
+    now = datetime.utcnow()
+    changes = []
+    for row in rows:
+        previous = old_listings.get(product_key(row))
+        if previous is not None and previous[1] != row['product_price']:
+            changes.append((previous[0], row['product_name'], previous[1], row['product_price']))
+    if changes:
+        db.session.execute(insert(PriceHistory), [
+            {"product_id": product_id, "old_price": old_price, "new_price": new_price, "change_date": now}
+            for product_id, _, old_price, new_price in changes
+        ])
+    return changes
+
+
+def upsert_products(products, batch_size=INGEST_BATCH_SIZE, commit=True, cluster=CLUSTER_ON_INGEST):
+    """
+    Insert or update crawled products in bulk, keyed on (shop_name, product_url).
+
+    Each batch is written as a single multi-row INSERT ... ON CONFLICT DO UPDATE ...
+    RETURNING statement, so the ids come back in the same round trip. Listings whose
+    price changed get a PriceHistory row. Returns the product ids in the same order
+    as the input. New and renamed listings are assigned to product clusters (unless
+    `cluster` is off, as for bulk imports), and price drops are passed on to the
+    price alert engine.
+    """
+    # Collapse duplicate listings; PostgreSQL refuses to update the same row twice in one statement
+    rows = {}
+    for product in products:
+        rows[product_key(product)] = _product_row(product)
+    rows = list(rows.values())
+
+    stmt = insert_for(Product.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(PRODUCT_KEY),
+        set_={column: stmt.excluded[column] for column in UPDATE_COLUMNS},
+    ).returning(Product.shop_name, Product.product_url, Product.id)
+
+    ids_by_key = {}
+    price_changes = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        old_listings = _current_listings(batch)
+
+        # executemany + RETURNING is sent as one multi-row statement per batch. Ids are matched
+        # back by listing key: requesting parameter order makes SQLAlchemy send upserts row by row
+        result = db.session.execute(stmt, batch)
+        for shop_name, product_url, product_id in result:
+            ids_by_key[(shop_name, product_url)] = product_id
+
+        price_changes.extend(_record_price_changes(batch, old_listings))
+
+        if cluster:
+            old_names = {key: listing[2] for key, listing in old_listings.items()}
+            assign_clusters([
+                ids_by_key[product_key(row)] for row in batch
+                if old_names.get(product_key(row)) != row['product_name']
+            ])
+
+    if commit:
+        db.session.commit()
+
+    # Drop cached summaries of rewritten listings and keep the autocomplete index in step
+    product_summaries.invalidate(ids_by_key.values())
+    product_index.update((ids_by_key[product_key(row)], row['product_name'], row['shop_name']) for row in rows)
+
+    # Price drops are matched against watchers in the background
+    alert_engine.submit(price_changes)
+
+    return [ids_by_key[product_key(product)] for product in products]
@@ -0,0 +1,215 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event
+
+from model import db
+
+# Share of requests that are timed (0 disables instrumentation); adjustable at runtime
+SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+
+# Histogram precision: 2**SUB_BUCKET_BITS buckets per power of two, i.e. about 3% relative error
+SUB_BUCKET_BITS = 6
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+
+def _bucket(value):
+    """Log-linear bucket index: exact below 2**SUB_BUCKET_BITS, then fixed precision per power of two."""
+    shift = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+    return shift * _HALF + (value >> shift)
+
+
+def _bucket_value(index):
+    """Lowest value that falls in a bucket."""
+    if index < 2 * _HALF:
+        return index
+    shift = index // _HALF - 1
+    return (index - shift * _HALF) << shift
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations in microseconds.
+
+    Recording is O(1) into sparse log-linear buckets, so memory stays small for any
+    range of values while percentiles keep a bounded relative error.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        index = _bucket(value)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """Value (microseconds) at or below which `percent` of the recorded values fall."""
+        with self._lock:
+            counts = sorted(self._counts.items())
+            count = self.count
+        if not count:
+            return 0
+        rank = max(1, round(count * percent / 100))
+        seen = 0
+        for index, bucket_count in counts:
+            seen += bucket_count
+            if seen >= rank:
+                return min(_bucket_value(index + 1) - 1, self.max)
+        return self.max
+
+    def snapshot(self):
+        stats = {"count": self.count}
+        if self.count:
+            stats["mean_ms"] = round(self.total / self.count / 1000, 3)
+            stats["max_ms"] = round(self.max / 1000, 3)
+            for percent in PERCENTILES:
+                stats[f"p{percent:g}_ms"] = round(self.percentile(percent) / 1000, 3)
+        return stats
+
+
+class RequestStats:
+    """Timings collected for one sampled request."""
+
+    __slots__ = ('start', 'sql_count', 'sql_time', 'spans')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.spans = {}
+
+
+class Instrumentation:
+    """
+    Per-request timers, SQL statement accounting and named spans, aggregated into
+    latency histograms per endpoint, per span and for SQL.
+
+    Only a sample of requests (sample_rate) is measured; everything else pays for a
+    single random() call. Sampled responses carry a Server-Timing header.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._histograms = {}
+        self._sql_counts = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def set_sample_rate(self, rate):
+        self.sample_rate = min(max(float(rate), 0.0), 1.0)
+
+    def current(self):
+        """Stats of the request being measured on this thread, or None."""
+        return getattr(self._local, 'stats', None)
+
+    @contextmanager
+    def span(self, name):
+        """Time a named stage of the current request (no-op when it is not sampled)."""
+        stats = self.current()
+        if stats is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.spans[name] = stats.spans.get(name, 0.0) + elapsed
+            self.histogram('span:' + name).record(elapsed)
+
+    def init_app(self, app):
+        """Install request hooks and SQL listeners on every engine of the app."""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_request(self):
+        if self.sample_rate and random.random() < self.sample_rate:
+            self._local.stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = self.current()
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.start
+        endpoint = request.endpoint or 'unmatched'
+        self.histogram('request:' + endpoint).record(elapsed)
+        with self._lock:
+            self._sql_counts[endpoint] = self._sql_counts.get(endpoint, 0) + stats.sql_count
+
+        timings = [f"total;dur={elapsed * 1000:.2f}", f'sql;dur={stats.sql_time * 1000:.2f};desc="{stats.sql_count} queries"']
+        timings += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stats.spans.items()]
+        response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    def _teardown_request(self, exc):
+        self._local.stats = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current() is not None:
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        starts = conn.info.get('query_start')
+        if stats is None or not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        self.histogram('sql').record(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+            sql_counts = dict(self._sql_counts)
+        report = {"sample_rate": self.sample_rate, "requests": {}, "spans": {}, "sql": {}}
+        for name, histogram in sorted(histograms.items()):
+            kind, _, label = name.partition(':')
+            if kind == 'request':
+                stats = histogram.snapshot()
+                if stats["count"]:
+                    stats["sql_per_request"] = round(sql_counts.get(label, 0) / stats["count"], 2)
+                report["requests"][label] = stats
+            elif kind == 'span':
+                report["spans"][label] = histogram.snapshot()
+            else:
+                report["sql"] = histogram.snapshot()
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._sql_counts = {}
+
+
+instrumentation = Instrumentation()
+span = instrumentation.span
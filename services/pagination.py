@@ -0,0 +1,21 @@
+import json
+import base64
+
+
+def encode_cursor(*values):
+    """Encode the keyset position of the last row on a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decode a cursor produced by encode_cursor(), converting each value with the
+    matching type. Raises ValueError if the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(types):
+            raise ValueError
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except Exception:
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from werkzeug.security import check_password_hash
+
+# bcrypt work factor for new hashes; existing hashes are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Worker processes used for hashing (0 hashes in the calling thread)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Maximum hashes queued or running at once, and how long a request waits for a slot
+MAX_PENDING_HASHES = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+# The pool starts lazily inside a threaded server, so its workers must not be forked from
+# it (a child could inherit a lock held by another thread); forkserver where available
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify_password(password, password_hash):
+    if password_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    # Hashes created before bcrypt was standardised (werkzeug pbkdf2/scrypt)
+    return check_password_hash(password_hash, password)
+
+
+def hash_cost(password_hash):
+    """Return the bcrypt cost of a hash, or None if it is not a bcrypt hash."""
+    parts = password_hash.split('$')
+    if len(parts) > 2 and parts[1].startswith('2') and parts[2].isdigit():
+        return int(parts[2])
+    return None
+
+
+class PasswordHasher:
+    """
+    Single entry point for password hashing.
+
+    Hashing is CPU bound, so it runs in a process pool instead of the request thread.
+    A bounded number of hashes may be queued at once; beyond that callers get
+    PasswordServiceBusy rather than piling up behind a login burst.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS, max_pending=MAX_PENDING_HASHES,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(POOL_START_METHOD)
+                    )
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordServiceBusy("Too many password operations in progress")
+        try:
+            if not self.workers:
+                return fn(*args)
+            return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        return self._run(_verify_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        return hash_cost(password_hash) != self.rounds
+
+    def verify_and_update(self, password, password_hash):
+        """
+        Check a password and, when it matches a hash with an outdated cost or scheme,
+        return a fresh hash as well. Returns (valid, new_hash_or_None).
+        """
+        if not self.verify(password, password_hash):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, self.hash(password)
+        return True, None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+password_hasher = PasswordHasher()
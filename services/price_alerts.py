@@ -0,0 +1,337 @@
+import bisect
+import os
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from model import PriceAlert, SearchQuerySummary, User, db
+from services.fulltext import tokenize
+from services.search_cache import normalize_query
+from services.sms_outbox import enqueue_sms, sms_dispatcher
+
+# Queries a user searched at least ALERT_MIN_SEARCHES times in the last ALERT_WATCH_DAYS
+# days are watched implicitly, and alert on drops of DEFAULT_DROP_PERCENT or more
+ALERT_MIN_SEARCHES = int(os.getenv("ALERT_MIN_SEARCHES", "2"))
+ALERT_WATCH_DAYS = int(os.getenv("ALERT_WATCH_DAYS", "30"))
+DEFAULT_DROP_PERCENT = float(os.getenv("ALERT_DEFAULT_DROP_PERCENT", "10"))
+
+# Price changes are matched in batches, at least this often (seconds) or once this many are queued
+ALERT_FLUSH_INTERVAL = float(os.getenv("ALERT_FLUSH_INTERVAL", "30"))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "5000"))
+
+# Queued price changes beyond this are dropped (oldest first) rather than growing without bound
+MAX_PENDING_CHANGES = 200000
+
+# A batch that fails to match this many times in a row is logged and dropped
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "3"))
+
+# The watcher index is rebuilt from the database this often (seconds)
+ALERT_INDEX_REFRESH = float(os.getenv("ALERT_INDEX_REFRESH", "600"))
+
+# A user hears about the same product at most once per cooldown (seconds)
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", str(24 * 3600)))
+MAX_COOLDOWN_ENTRIES = 1000000
+
+# Products listed per notification message
+MAX_PRODUCTS_PER_MESSAGE = 3
+
+
+class QueryGroup:
+    """Everyone watching one normalized query, split by the kind of threshold."""
+
+    __slots__ = ('query', 'tokens', 'followers', 'price_targets', 'drop_targets')
+
+    def __init__(self, query, tokens):
+        self.query = query
+        self.tokens = tokens
+        self.followers = array('q')  # Implicit watchers (search history), DEFAULT_DROP_PERCENT
+        self.price_targets = []  # (-max_price, user_id, alert_id), so the highest targets come first
+        self.drop_targets = []  # (min_drop_percent, user_id, alert_id), smallest first
+
+    def matches(self, new_price, drop_percent):
+        """Yield (user_id, alert_id) for the watchers whose threshold this drop meets."""
+        if drop_percent >= DEFAULT_DROP_PERCENT:
+            for user_id in self.followers:
+                yield user_id, None
+        for negated_price, user_id, alert_id in self.price_targets:
+            if -negated_price < new_price:
+                break
+            yield user_id, alert_id
+        for min_drop, user_id, alert_id in self.drop_targets:
+            if min_drop > drop_percent:
+                break
+            yield user_id, alert_id
+
+
+class AlertIndex:
+    """
+    Watched queries indexed by one anchor token each.
+
+    A product can only match a query containing the anchor, so a price change is
+    matched by looking up each of the product's name tokens, not by scanning the
+    watchers. The anchor is the query token that is least common among watched
+    queries, which keeps the lists behind popular words like brand names short.
+    Request threads add and remove alerts while the matcher reads, so both go
+    through one lock.
+    """
+
+    def __init__(self):
+        self._groups = {}  # normalized query -> QueryGroup
+        self._anchors = {}  # token -> [QueryGroup]
+        self._token_counts = Counter()
+        self._lock = threading.Lock()
+        self.watchers = 0
+
+    def __len__(self):
+        return len(self._groups)
+
+    def _group(self, query):
+        query = normalize_query(query)
+        group = self._groups.get(query)
+        if group is None:
+            tokens = frozenset(tokenize(query))
+            if not tokens:
+                return None
+            group = self._groups[query] = QueryGroup(query, tokens)
+            anchor = min(tokens, key=lambda token: (self._token_counts[token], -len(token), token))
+            self._anchors.setdefault(anchor, []).append(group)
+        return group
+
+    def count_tokens(self, queries):
+        """Prime the anchor choice with the queries about to be added (build time)."""
+        for query in queries:
+            self._token_counts.update(set(tokenize(normalize_query(query))))
+
+    def add_follower(self, query, user_id):
+        with self._lock:
+            group = self._group(query)
+            if group is not None:
+                group.followers.append(user_id)
+                self.watchers += 1
+
+    def add_alert(self, alert):
+        with self._lock:
+            group = self._group(alert.search_query)
+            if group is None:
+                return
+            if alert.max_price is not None:
+                bisect.insort(group.price_targets, (-alert.max_price, alert.user_id, alert.id))
+            if alert.min_drop_percent is not None or alert.max_price is None:
+                min_drop = alert.min_drop_percent if alert.min_drop_percent is not None else DEFAULT_DROP_PERCENT
+                bisect.insort(group.drop_targets, (min_drop, alert.user_id, alert.id))
+            self.watchers += 1
+
+    def remove_alert(self, alert):
+        with self._lock:
+            group = self._groups.get(normalize_query(alert.search_query))
+            if group is not None:
+                group.price_targets = [t for t in group.price_targets if t[2] != alert.id]
+                group.drop_targets = [t for t in group.drop_targets if t[2] != alert.id]
+
+    def match(self, product_name, old_price, new_price):
+        """Return (user_id, alert_id, query) for every watcher of a price drop."""
+        if not old_price or new_price >= old_price:
+            return []
+        drop_percent = (old_price - new_price) / old_price * 100
+        tokens = set(tokenize(product_name))
+        matched = []
+        with self._lock:
+            for token in tokens:
+                for group in self._anchors.get(token, ()):
+                    if group.tokens <= tokens:
+                        matched.extend(
+                            (user_id, alert_id, group.query)
+                            for user_id, alert_id in group.matches(new_price, drop_percent)
+                        )
+        return matched
+
+
+def load_index():
+    """Build an AlertIndex from active price alerts and recent, repeated searches."""
+    since = datetime.utcnow() - timedelta(days=ALERT_WATCH_DAYS)
+    alerts = PriceAlert.query.filter_by(active=True).all()
+    followed = db.session.execute(
+        select(SearchQuerySummary.user_id, SearchQuerySummary.search_query).where(
+            SearchQuerySummary.hit_count >= ALERT_MIN_SEARCHES, SearchQuerySummary.last_searched >= since
+        )
+    ).all()
+
+    index = AlertIndex()
+    index.count_tokens([alert.search_query for alert in alerts])
+    index.count_tokens([query for _, query in followed])
+    explicit = {(alert.user_id, alert.search_query) for alert in alerts}
+    for alert in alerts:
+        index.add_alert(alert)
+    for user_id, query in followed:
+        if (user_id, query) not in explicit:  # An explicit alert's threshold wins
+            index.add_follower(query, user_id)
+    return index
+
+
+def alert_message(products):
+    lines = [f"{name[:60]}: {old:,.0f} -> {new:,.0f}" for name, old, new in products[:MAX_PRODUCTS_PER_MESSAGE]]
+    more = len(products) - MAX_PRODUCTS_PER_MESSAGE
+    if more > 0:
+        lines.append(f"and {more} more")
+    return "Price drop! " + "; ".join(lines)
+
+
+class AlertEngine:
+    """
+    Background matcher from ingested price drops to watching users.
+
+    upsert_products submits price changes; a worker thread matches them in batches
+    against the AlertIndex and queues one SMS per user per batch through the outbox.
+    A batch that fails is put back and retried, then logged and dropped after
+    ALERT_MAX_ATTEMPTS consecutive failures.
+    """
+
+    def __init__(self, flush_interval=ALERT_FLUSH_INTERVAL, batch_size=ALERT_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = deque(maxlen=MAX_PENDING_CHANGES)
+        self._index = None
+        self._index_built = 0.0
+        self._notified = OrderedDict()  # (user_id, product_id) -> monotonic time
+        self._failures = 0  # Consecutive failed attempts at the batch at the front of _pending
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._app = None
+        self._thread = None
+
+    def submit(self, changes):
+        """Queue (product_id, product_name, old_price, new_price) changes; only drops are kept."""
+        drops = [change for change in changes if change[3] < change[2]]
+        if not drops:
+            return
+        self._pending.extend(drops)
+        self._ensure_started()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def index(self):
+        """The current watcher index, rebuilt when older than ALERT_INDEX_REFRESH. Needs an app context."""
+        if self._index is None or time.monotonic() - self._index_built > ALERT_INDEX_REFRESH:
+            self._index = load_index()
+            self._index_built = time.monotonic()
+        return self._index
+
+    def alert_added(self, alert):
+        if self._index is not None:
+            self._index.add_alert(alert)
+
+    def alert_removed(self, alert):
+        if self._index is not None:
+            self._index.remove_alert(alert)
+
+    def _cooling_down(self, user_id, product_id, now, marked):
+        key = (user_id, product_id)
+        last = self._notified.get(key)
+        if last is not None and now - last < ALERT_COOLDOWN:
+            return True
+        marked.append(key)
+        self._notified[key] = now
+        self._notified.move_to_end(key)
+        while len(self._notified) > MAX_COOLDOWN_ENTRIES:
+            self._notified.popitem(last=False)
+        return False
+
+    def process_pending(self):
+        """Match one batch of queued price drops and queue notifications. Returns the changes processed."""
+        with self._process_lock:
+            changes = []
+            while self._pending and len(changes) < self.batch_size:
+                changes.append(self._pending.popleft())
+            if not changes:
+                return 0
+
+            marked = []  # Cooldowns started by this batch, undone if it fails
+            try:
+                notified = self._notify(changes, marked)
+            except Exception:
+                db.session.rollback()
+                for key in marked:
+                    self._notified.pop(key, None)
+                self._failures += 1
+                if self._failures < ALERT_MAX_ATTEMPTS:
+                    self._pending.extendleft(reversed(changes))  # Retried first on the next run
+                else:
+                    self._failures = 0
+                    current_app.logger.error(
+                        "Dropping %d price changes after %d failed attempts to match them: %r",
+                        len(changes), ALERT_MAX_ATTEMPTS, changes[:20],
+                    )
+                raise
+            self._failures = 0
+
+            if notified:
+                sms_dispatcher.ensure_started(self._app or current_app._get_current_object())
+                sms_dispatcher.wake()
+            return len(changes)
+
+    def _notify(self, changes, marked):
+        """Queue the notifications for a batch of changes and commit. Returns whether any were queued."""
+        index = self.index()
+        now = time.monotonic()
+        per_user, alert_ids = {}, set()
+        for product_id, name, old_price, new_price in changes:
+            seen = set()
+            for user_id, alert_id, _ in index.match(name, old_price, new_price):
+                if user_id in seen or self._cooling_down(user_id, product_id, now, marked):
+                    continue
+                seen.add(user_id)
+                per_user.setdefault(user_id, []).append((name, old_price, new_price))
+                if alert_id is not None:
+                    alert_ids.add(alert_id)
+        if not per_user:
+            return False
+
+        phones = dict(db.session.execute(
+            select(User.id, User.phone_number).where(User.id.in_(list(per_user)))
+        ).all())
+        for user_id, products in per_user.items():
+            if phones.get(user_id):
+                enqueue_sms(phones[user_id], alert_message(products))
+        if alert_ids:
+            db.session.execute(
+                update(PriceAlert).where(PriceAlert.id.in_(alert_ids)).values(last_notified_at=datetime.utcnow())
+            )
+        db.session.commit()
+        return True
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = current_app._get_current_object()
+            self._thread = threading.Thread(target=self._run, name='price-alerts', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    while self.process_pending():
+                        pass
+            except Exception:
+                self._app.logger.exception("Matching price alerts failed")
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+alert_engine = AlertEngine()
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from model import Product, db
+
+# Product summaries kept in memory (LRU)
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "50000"))
+
+# Upper bound on staleness for changes made by other processes (seconds);
+# changes ingested by this process invalidate their entries immediately
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "60"))
+
+SUMMARY_COLUMNS = (Product.id, Product.product_name, Product.product_price, Product.delivery_cost, Product.payment_mode)
+
+
+class ProductSummary:
+    """The few product fields the payment endpoints need."""
+
+    __slots__ = ('id', 'product_name', 'product_price', 'delivery_cost', 'payment_mode', 'loaded_at')
+
+    def __init__(self, id, product_name, product_price, delivery_cost, payment_mode, loaded_at):
+        self.id = id
+        self.product_name = product_name
+        self.product_price = product_price
+        self.delivery_cost = delivery_cost
+        self.payment_mode = payment_mode
+        self.loaded_at = loaded_at
+
+    @property
+    def total_cost(self):
+        return self.product_price + self.delivery_cost
+
+
+class ProductSummaryCache:
+    """
+    Read-through LRU of ProductSummary objects keyed by product id.
+
+    Misses are loaded with a single column query (no ORM objects). Entries are
+    dropped when upsert_products writes the product, and expire after
+    PRODUCT_CACHE_TTL seconds as a bound on changes made by other processes.
+    """
+
+    def __init__(self, max_entries=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0  # Bumped on invalidation so in-flight loads do not store stale rows
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, product_id):
+        """Return the summary for a product id, or None if there is no such product."""
+        return self.get_many([product_id]).get(product_id)
+
+    def get_many(self, product_ids):
+        """Return {product_id: ProductSummary} for the ids that exist, loading all misses in one query."""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for product_id in product_ids:
+                summary = self._entries.get(product_id)
+                if summary is not None and now - summary.loaded_at < self.ttl:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = summary
+                else:
+                    missing.append(product_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            rows = db.session.execute(select(*SUMMARY_COLUMNS).where(Product.id.in_(set(missing))))
+            loaded = [ProductSummary(*row, loaded_at=now) for row in rows]
+            with self._lock:
+                if generation == self._generation:
+                    for summary in loaded:
+                        self._entries[summary.id] = summary
+                        self._entries.move_to_end(summary.id)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            found.update((summary.id, summary) for summary in loaded)
+        return found
+
+    def fresh(self, product_id):
+        """
+        Load a product straight from the database, bypassing the cache, for paths that
+        must not act on a stale price (charging a payment). Refreshes the cached entry.
+        """
+        with self._lock:
+            generation = self._generation
+        row = db.session.execute(select(*SUMMARY_COLUMNS).where(Product.id == product_id)).first()
+        if row is None:
+            return None
+        summary = ProductSummary(*row, loaded_at=time.monotonic())
+        with self._lock:
+            if generation == self._generation:
+                self._entries[summary.id] = summary
+                self._entries.move_to_end(summary.id)
+        return summary
+
+    def invalidate(self, product_ids=None):
+        """Drop the given products (or everything) from the cache."""
+        with self._lock:
+            self._generation += 1
+            if product_ids is None:
+                self._entries.clear()
+            else:
+                for product_id in product_ids:
+                    self._entries.pop(product_id, None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+product_summaries = ProductSummaryCache()
@@ -0,0 +1,229 @@
+import os
+import heapq
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from model import Product, RankedProduct, db
+from services.ingest import insert_for
+
+# Rankings for queries nobody has searched for this long are removed by compact_rankings()
+RANKING_TTL_DAYS = int(os.getenv("RANKING_TTL_DAYS", "7"))
+
+# ranked_at of unchanged rows is refreshed at most this often, well within RANKING_TTL_DAYS
+RANKED_AT_REFRESH = timedelta(days=1)
+
+# Delivery costs below this are treated as this value so free delivery cannot divide by zero
+MIN_DELIVERY_COST = 1.0
+
+
+class ScoreWeights:
+    """
+    Weights used to compute MB (Marketability) and CB (Customer Benefit) scores.
+
+    mb_score = rating * rating_weight + num_ratings * num_ratings_weight
+    cb_score = product_price / max(delivery_cost, min_delivery_cost)
+    """
+    __slots__ = ('rating_weight', 'num_ratings_weight', 'min_delivery_cost')
+
+    def __init__(self, rating_weight=10.0, num_ratings_weight=0.1, min_delivery_cost=MIN_DELIVERY_COST):
+        self.rating_weight = rating_weight
+        self.num_ratings_weight = num_ratings_weight
+        self.min_delivery_cost = min_delivery_cost
+
+
+DEFAULT_WEIGHTS = ScoreWeights()
+
+# Fields of the product dicts copied into each ranked result
+RESULT_FIELDS = ('product_name', 'product_price', 'product_rating', 'shop_name')
+
+
+def to_columns(products):
+    """Split a list of product dicts into the column lists the scorer works on."""
+    return {
+        'product_rating': [p.get('product_rating') or 0.0 for p in products],
+        'num_ratings': [p.get('num_ratings') or 0 for p in products],
+        'product_price': [p['product_price'] for p in products],
+        'delivery_cost': [p.get('delivery_cost') or 0.0 for p in products],
+    }
+
+
+def score_columns(columns, weights=DEFAULT_WEIGHTS):
+    """
+    Compute MB and CB scores for whole columns at once.
+    Returns two lists aligned with the input columns.
+    """
+    rating_weight = weights.rating_weight
+    num_ratings_weight = weights.num_ratings_weight
+    floor = weights.min_delivery_cost
+
+    mb_scores = [
+        rating * rating_weight + num_ratings * num_ratings_weight
+        for rating, num_ratings in zip(columns['product_rating'], columns['num_ratings'])
+    ]
+    cb_scores = [
+        price / (delivery if delivery > floor else floor)
+        for price, delivery in zip(columns['product_price'], columns['delivery_cost'])
+    ]
+    return mb_scores, cb_scores
+
+
+def top_k(scores, k=None):
+    """
+    Return the indices of the k highest scores, best first (ties keep input order).
+    Uses a bounded heap, so only the requested page is ever sorted.
+    """
+    if k is None or k >= len(scores):
+        return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+    return heapq.nlargest(k, range(len(scores)), key=scores.__getitem__)
+
+
+def rank_products(products, limit=None, weights=DEFAULT_WEIGHTS, sort_key='mb_score'):
+    """
+    Score a whole result set and return the top `limit` products as ranked dicts.
+    """
+    if not products:
+        return []
+
+    mb_scores, cb_scores = score_columns(to_columns(products), weights)
+    order = top_k(mb_scores if sort_key == 'mb_score' else cb_scores, limit)
+
+    ranked = []
+    for rank, index in enumerate(order, start=1):
+        product = products[index]
+        result = {field: product.get(field) for field in RESULT_FIELDS}
+        result.update(rank=rank, mb_score=mb_scores[index], cb_score=cb_scores[index])
+        if 'id' in product:
+            result['product_id'] = product['id']
+        ranked.append(result)
+    return ranked
+
+
+# Product fields the scores depend on; a product is rescored only when one of these changes
+SCORE_INPUTS = ('product_price', 'product_rating', 'num_ratings', 'delivery_cost')
+
+
+def _inputs_changed(ranked_product, product):
+    return any(getattr(ranked_product, field) != product.get(field) for field in SCORE_INPUTS)
+
+
+def update_rankings(search_query, products, complete=True, limit=None, weights=DEFAULT_WEIGHTS):
+    """
+    Incrementally update the stored ranking for a normalized query.
+
+    Only products that are new, or whose price, rating or delivery cost changed since
+    the last crawl, are rescored; ranks are then adjusted in place for the top `limit`
+    (rows below it keep rank 0). New rows are upserted, so concurrent crawls of the
+    same query don't collide. When the crawl was complete, rankings for products the
+    shops no longer return are deleted. Does not commit. Returns the top `limit`
+    products as ranked dicts.
+    """
+    existing = {rp.product_id: rp for rp in RankedProduct.query.filter_by(search_query=search_query)}
+    products_by_id = {product['id']: product for product in products}
+    now = datetime.utcnow()
+
+    # Rescore only what changed, in one batch
+    changed = [
+        product for product_id, product in products_by_id.items()
+        if product_id not in existing or _inputs_changed(existing[product_id], product)
+    ]
+    mb_scores, cb_scores = score_columns(to_columns(changed), weights)
+    new_rows = []
+    for product, mb_score, cb_score in zip(changed, mb_scores, cb_scores):
+        ranked_product = existing.get(product['id'])
+        if ranked_product is None:
+            row = {field: product.get(field) for field in SCORE_INPUTS}
+            row.update(search_query=search_query, product_id=product['id'], mb_score=mb_score,
+                       cb_score=cb_score, rank=0, ranked_at=now)
+            new_rows.append(row)
+            continue
+        ranked_product.mb_score = mb_score
+        ranked_product.cb_score = cb_score
+        ranked_product.ranked_at = now
+        for field in SCORE_INPUTS:
+            setattr(ranked_product, field, product.get(field))
+
+    # Another process may insert the same rows concurrently; the later crawl's scores win
+    if new_rows:
+        stmt = insert_for(RankedProduct.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['search_query', 'product_id'],
+            set_={field: stmt.excluded[field] for field in SCORE_INPUTS + ('mb_score', 'cb_score', 'ranked_at')},
+        )
+        db.session.execute(stmt, new_rows)
+        added = RankedProduct.query.filter(
+            RankedProduct.search_query == search_query,
+            RankedProduct.product_id.in_([row['product_id'] for row in new_rows]),
+        )
+        existing.update((rp.product_id, rp) for rp in added)
+
+    # Keep rankings of queries still being searched from expiring, without rewriting every row each crawl
+    for product_id in products_by_id:
+        ranked_product = existing.get(product_id)
+        if ranked_product is not None and (ranked_product.ranked_at is None or ranked_product.ranked_at < now - RANKED_AT_REFRESH):
+            ranked_product.ranked_at = now
+
+    # Superseded rankings: products that every shop answered for but no longer list
+    if complete:
+        for product_id in [pid for pid in existing if pid not in products_by_id]:
+            db.session.delete(existing.pop(product_id))
+
+    # Re-rank the top `limit`; only rows whose position moved are written back
+    ranked_products = list(existing.values())
+    order = top_k([rp.mb_score for rp in ranked_products], limit)
+    positions = {index: rank for rank, index in enumerate(order, start=1)}
+    for index, ranked_product in enumerate(ranked_products):
+        rank = positions.get(index, 0)
+        if ranked_product.rank != rank:
+            ranked_product.rank = rank
+    db.session.flush()
+
+    results = []
+    for index in order:
+        ranked_product = ranked_products[index]
+        product = products_by_id.get(ranked_product.product_id)
+        if product is None:
+            continue  # Kept from a shop that timed out; not part of this crawl
+        result = {field: product.get(field) for field in RESULT_FIELDS}
+        result.update(
+            rank=ranked_product.rank,
+            mb_score=ranked_product.mb_score,
+            cb_score=ranked_product.cb_score,
+            product_id=ranked_product.product_id,
+        )
+        results.append(result)
+    return results
+
+
+def ranked_offers(search_query):
+    """
+    Every stored ranking for a normalized query as ranked dicts, best first, including
+    the products below the served page.
+    """
+    rows = db.session.execute(
+        select(RankedProduct.product_id, RankedProduct.mb_score, RankedProduct.cb_score,
+               *(getattr(Product, field) for field in RESULT_FIELDS))
+        .join(Product, Product.id == RankedProduct.product_id)
+        .where(RankedProduct.search_query == search_query)
+        .order_by(RankedProduct.mb_score.desc(), RankedProduct.product_id)
+    )
+    results = []
+    for rank, (product_id, mb_score, cb_score, *fields) in enumerate(rows, start=1):
+        result = dict(zip(RESULT_FIELDS, fields))
+        result.update(rank=rank, mb_score=mb_score, cb_score=cb_score, product_id=product_id)
+        results.append(result)
+    return results
+
+
+def compact_rankings(ttl_days=RANKING_TTL_DAYS):
+    """
+    Delete superseded rankings: legacy rows written before rankings were keyed
+    per query, and queries that have not been re-ranked within ttl_days.
+    Returns the number of rows removed.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+    removed = RankedProduct.query.filter(
+        db.or_(RankedProduct.search_query.is_(None), RankedProduct.ranked_at < cutoff)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -0,0 +1,186 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+from services.auth_cache import bearer_token, token_cache
+
+# A bucket holds up to `burst` requests and refills at `rate` requests per second
+Limit = namedtuple('Limit', ['burst', 'rate'])
+
+
+def env_limit(prefix, burst, rate):
+    """Read a Limit from <prefix>_BURST and <prefix>_RATE. Raises ValueError unless burst >= 1 and rate > 0."""
+    limit = Limit(int(os.getenv(f"{prefix}_BURST", burst)), float(os.getenv(f"{prefix}_RATE", rate)))
+    if limit.burst < 1 or not limit.rate > 0:
+        raise ValueError(f"{prefix}_BURST must be at least 1 and {prefix}_RATE greater than 0, got {limit}")
+    return limit
+
+
+# /search per signed-in user and per client IP (anonymous users share their IP's bucket)
+SEARCH_USER_LIMIT = env_limit("SEARCH_USER", "10", "0.5")
+SEARCH_IP_LIMIT = env_limit("SEARCH_IP", "30", "2")
+
+# Crawls (search cache misses and refreshes) across all users, to cap the load on shops
+CRAWL_LIMIT = env_limit("CRAWL", "20", "5")
+
+# Share buckets between workers through Redis when set (the redis package is imported lazily)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+# Buckets tracked in-process; the least recently used are dropped beyond this
+MAX_TRACKED_KEYS = 100000
+
+# After a Redis error, limits are enforced in-process for this long (seconds) before retrying Redis
+REDIS_RETRY_SECONDS = 30
+
+# Atomic token bucket: KEYS[1] = bucket, ARGV = burst, rate, cost. Returns the wait in seconds (0 = allowed).
+TOKEN_BUCKET_LUA = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class MemoryStore:
+    """Token buckets in this process, bounded to the MAX_TRACKED_KEYS most recently used."""
+
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time of the last update)
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, cost=1):
+        """Spend `cost` tokens; returns 0 if allowed, else the seconds until it would be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisStore:
+    """
+    Token buckets in Redis, shared by every worker, updated atomically by a Lua script.
+    While Redis is unreachable the in-process store takes over, so limits degrade to
+    per-worker instead of failing requests.
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self._script = self._client.register_script(TOKEN_BUCKET_LUA)
+        self._errors = redis.RedisError
+        self._fallback = MemoryStore()
+        self._fallback_until = 0.0
+        self.prefix = prefix
+
+    def take(self, key, limit, cost=1):
+        if time.monotonic() < self._fallback_until:
+            return self._fallback.take(key, limit, cost)
+        try:
+            return float(self._script(keys=[self.prefix + key], args=[limit.burst, limit.rate, cost]))
+        except self._errors:
+            current_app.logger.warning("Rate limit store unreachable; limiting in-process for %ss", REDIS_RETRY_SECONDS)
+            self._fallback_until = time.monotonic() + REDIS_RETRY_SECONDS
+            return self._fallback.take(key, limit, cost)
+
+
+class RateLimiter:
+    """Token-bucket limits keyed by name, backed by Redis when configured, in-process otherwise."""
+
+    def __init__(self, redis_url=RATE_LIMIT_REDIS_URL):
+        self.redis_url = redis_url
+        self._store = None
+        self._lock = threading.Lock()
+        self.limited = {}
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = RedisStore(self.redis_url) if self.redis_url else MemoryStore()
+        return self._store
+
+    def take(self, key, limit, cost=1):
+        wait = self.store.take(key, limit, cost)
+        if wait:
+            name = key.partition(':')[0]
+            self.limited[name] = self.limited.get(name, 0) + 1
+        return wait
+
+    def check(self, key, limit, cost=1):
+        """Spend tokens or raise RateLimited with the time to wait."""
+        wait = self.take(key, limit, cost)
+        if wait:
+            raise RateLimited(wait)
+
+
+def client_keys():
+    """Bucket keys for the current request: the signed-in user (if any) and the client IP."""
+    claims = token_cache.verify(bearer_token(request.headers.get('Authorization')))
+    user_id = claims.get('sub') if claims else None
+    return user_id, request.remote_addr or 'unknown'
+
+
+def too_many_requests(retry_after):
+    response = jsonify({"message": "Too many requests, please retry later", "retry_after": round(retry_after, 1)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limited(name, per_user, per_ip):
+    """
+    Limit a view per signed-in user and per client IP. Over the limit, the view
+    answers 429 with a Retry-After header. Requests behind a proxy need the proxy's
+    client address in remote_addr (e.g. werkzeug's ProxyFix).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id, ip = client_keys()
+            wait = rate_limiter.take(f"{name}-ip:{ip}", per_ip)
+            if not wait and user_id is not None:
+                wait = rate_limiter.take(f"{name}-user:{user_id}", per_user)
+            if wait:
+                return too_many_requests(wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+rate_limiter = RateLimiter()
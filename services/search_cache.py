@@ -0,0 +1,256 @@
+import os
+import time
+import calendar
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+
+from model import ProductSearch, db
+
+# How long (in seconds) results from each shop stay fresh
+SHOP_TTLS = {
+    "Jumia": 300,
+    "Kill Mall": 600,
+}
+DEFAULT_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+# Results from a partial crawl are only trusted for a short while
+PARTIAL_TTL = int(os.getenv("SEARCH_CACHE_PARTIAL_TTL", "30"))
+
+# After expiring, results may still be served for this long while a refresh runs
+STALE_WINDOW = int(os.getenv("SEARCH_CACHE_STALE_WINDOW", "600"))
+
+# Maximum number of queries kept in the in-process tier
+MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+
+
+def normalize_query(query):
+    """Normalize a search query so equivalent queries share a cache key."""
+    return ' '.join(query.lower().split())
+
+
+def ttl_for(shops, partial=False):
+    """The entry lives as long as its shortest-lived shop."""
+    ttl = min([SHOP_TTLS.get(shop, DEFAULT_TTL) for shop in shops] or [DEFAULT_TTL])
+    return min(ttl, PARTIAL_TTL) if partial else ttl
+
+
+class CacheEntry:
+    __slots__ = ('results', 'shops', 'missing', 'created_at', 'ttl')
+
+    def __init__(self, results, shops, missing, created_at, ttl):
+        self.results = results
+        self.shops = shops
+        self.missing = missing
+        self.created_at = created_at
+        self.ttl = ttl
+
+    def is_fresh(self, now):
+        return now < self.created_at + self.ttl
+
+    def is_servable(self, now, stale_window):
+        return now < self.created_at + self.ttl + stale_window
+
+    def to_json(self):
+        return {"results": self.results, "shops": self.shops, "missing": self.missing, "ttl": self.ttl}
+
+
+class SingleFlight:
+    """
+    At most one call per key at a time: concurrent callers with the same key wait for
+    the call in flight and share its result (or its exception).
+    """
+
+    class _Call:
+        __slots__ = ('done', 'result', 'error')
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, before_wait=None):
+        """
+        Return (fn(), False) if this caller ran fn, or (result, True) if it waited for
+        another caller's. before_wait runs before waiting, e.g. to release resources.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            if before_wait is not None:
+                before_wait()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class SearchCache:
+    """
+    Two-tier search result cache: an in-process LRU in front of ProductSearch rows.
+
+    Fresh entries are served directly. Expired entries still inside the stale window
+    are served immediately while a single background refresh recomputes them.
+    Concurrent misses for the same query share one computation.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, stale_window=STALE_WINDOW):
+        self.max_entries = max_entries
+        self.stale_window = stale_window
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search-refresh')
+        self._flight = SingleFlight()
+        self.counters = {"hits": 0, "db_hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load_persisted(self, key):
+        row = ProductSearch.query.filter_by(search_query=key).first()
+        if not row or not isinstance(row.query_results, dict):
+            return None
+        data = row.query_results
+        return CacheEntry(
+            data.get("results", []),
+            data.get("shops", []),
+            data.get("missing", []),
+            calendar.timegm(row.created_at.utctimetuple()),
+            data.get("ttl", DEFAULT_TTL),
+        )
+
+    def _persist(self, key, entry):
+        from services.ingest import insert_for  # ingest imports price_alerts, which imports us
+
+        # One upsert, so workers refreshing the same query at once don't hit the unique constraint
+        stmt = insert_for(ProductSearch).values(
+            search_query=key,
+            query_results=entry.to_json(),
+            created_at=datetime.utcfromtimestamp(entry.created_at),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['search_query'],
+            set_={'query_results': stmt.excluded.query_results, 'created_at': stmt.excluded.created_at},
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+    def store(self, key, results, shops, missing):
+        entry = CacheEntry(results, shops, missing, time.time(), ttl_for(shops, partial=bool(missing)))
+        self._put_local(key, entry)
+        self._persist(key, entry)
+        return entry
+
+    def get_or_compute(self, query, compute):
+        """
+        Serve a query from the cache, computing it on a miss.
+
+        compute(query) must return (results, crawl) where crawl is a CrawlResult.
+        Returns (entry, state) with state one of 'hit', 'stale', 'miss' or 'coalesced'
+        (a miss that waited for the same query's computation in another request).
+        """
+        key = normalize_query(query)
+        now = time.time()
+
+        entry = self._get_local(key)
+        from_db = False
+        if entry is None or not entry.is_fresh(now):
+            # Another worker may have refreshed the query since we cached it
+            persisted = self._load_persisted(key)
+            if persisted is not None and (entry is None or persisted.created_at > entry.created_at):
+                entry, from_db = persisted, True
+                self._put_local(key, entry)
+
+        if entry is not None and entry.is_fresh(now):
+            self._count("db_hits" if from_db else "hits")
+            return entry, 'hit'
+
+        if entry is not None and entry.is_servable(now, self.stale_window):
+            self._count("stale_hits")
+            self._refresh_async(key, query, compute)
+            return entry, 'stale'
+
+        # Waiters give their database connection back to the pool rather than idling on it
+        entry, shared = self._flight.do(key, lambda: self._compute(key, query, compute), before_wait=db.session.rollback)
+        self._count("coalesced" if shared else "misses")
+        return entry, 'coalesced' if shared else 'miss'
+
+    def _compute(self, key, query, compute):
+        results, crawl = compute(query)
+        missing = crawl.timed_out + list(crawl.failed)
+        return self.store(key, results, crawl.completed, missing)
+
+    def _refresh_async(self, key, query, compute):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        app = current_app._get_current_object()
+
+        def refresh():
+            try:
+                with app.app_context():
+                    self._flight.do(key, lambda: self._compute(key, query, compute))
+                self._count("refreshes")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_executor.submit(refresh)
+
+    def invalidate(self, query=None):
+        """Drop one query (or everything) from the in-process tier."""
+        with self._lock:
+            if query is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(normalize_query(query), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["db_hits"] + stats["stale_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = (lookups - stats["misses"] - stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+
+search_cache = SearchCache()
@@ -0,0 +1,265 @@
+import atexit
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select, tuple_
+
+from model import SearchHistory, SearchQuerySummary, db
+from services.ingest import insert_for
+from services.pagination import encode_cursor
+from services.search_cache import normalize_query
+
+# Buffered history events are written once this many are pending...
+HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", "200"))
+
+# ...or at least this often (seconds)
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2"))
+
+# A batch that fails to write this many times is logged and dropped
+HISTORY_MAX_FLUSH_ATTEMPTS = int(os.getenv("HISTORY_MAX_FLUSH_ATTEMPTS", "3"))
+
+# At most this many events are buffered; the oldest are dropped while writes keep failing
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "20000"))
+
+# History older than this is removed by prune_search_history()
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "180"))
+
+# Rows deleted per statement while pruning, to keep transactions short
+PRUNE_BATCH_SIZE = 5000
+
+
+def update_summaries(events):
+    """
+    Fold a batch of history events into the per-user query summaries with one upsert.
+    Does not commit.
+    """
+    totals = {}
+    for event in events:
+        key = (event["user_id"], normalize_query(event["search_query"]))
+        count, last = totals.get(key, (0, event["search_date"]))
+        totals[key] = (count + 1, max(last, event["search_date"]))
+    if not totals:
+        return
+
+    stmt = insert_for(SearchQuerySummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'search_query'],
+        set_={
+            'hit_count': SearchQuerySummary.hit_count + stmt.excluded.hit_count,
+            'last_searched': stmt.excluded.last_searched,
+        },
+    )
+    db.session.execute(stmt, [
+        {"user_id": user_id, "search_query": query, "hit_count": count, "last_searched": last}
+        for (user_id, query), (count, last) in totals.items()
+    ])
+
+
+def history_page(user_id, limit, cursor=None):
+    """
+    Return (rows, next_cursor) for one page of a user's history, newest first.
+    cursor is a decoded (search_date, id) pair from the previous page.
+    """
+    query = select(SearchHistory).where(SearchHistory.user_id == user_id)
+    if cursor is not None:
+        query = query.where(tuple_(SearchHistory.search_date, SearchHistory.id) < tuple_(*cursor))
+    query = query.order_by(SearchHistory.search_date.desc(), SearchHistory.id.desc()).limit(limit + 1)
+
+    rows = db.session.execute(query).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].search_date.isoformat(), rows[-1].id)
+    return rows, next_cursor
+
+
+def top_recent_queries(user_id, days=30, limit=10):
+    """
+    A user's most frequent queries among those searched in the last `days` days.
+    days is clamped to 1..HISTORY_RETENTION_DAYS, the span the summaries cover.
+    """
+    days = max(1, min(days, HISTORY_RETENTION_DAYS))
+    since = datetime.utcnow() - timedelta(days=days)
+    return (
+        SearchQuerySummary.query
+        .filter(SearchQuerySummary.user_id == user_id, SearchQuerySummary.last_searched >= since)
+        .order_by(SearchQuerySummary.hit_count.desc(), SearchQuerySummary.last_searched.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def prune_search_history(retention_days=HISTORY_RETENTION_DAYS, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Delete history (and summaries) older than the retention period, in short batches.
+    Returns the number of history rows removed.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    removed = 0
+    while True:
+        batch = select(SearchHistory.id).where(SearchHistory.search_date < cutoff).limit(batch_size)
+        deleted = SearchHistory.query.filter(SearchHistory.id.in_(batch)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += deleted
+        if deleted < batch_size:
+            break
+
+    SearchQuerySummary.query.filter(SearchQuerySummary.last_searched < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+class HistoryBuffer:
+    """
+    Write-behind buffer for search history.
+
+    Events are collected in memory and written with one bulk INSERT per flush, either
+    when HISTORY_FLUSH_SIZE events are pending or every HISTORY_FLUSH_INTERVAL seconds,
+    and once more at shutdown. Repeating the same query back to back while the first
+    search is still buffered only moves its timestamp forward instead of adding a row;
+    the repeat still counts towards the query summary.
+
+    A batch that fails to write is retried on its own at the next flush, ahead of newer
+    events, and dropped with an error after HISTORY_MAX_FLUSH_ATTEMPTS tries so one bad
+    event can't block the buffer. At most HISTORY_MAX_PENDING events are held.
+    """
+
+    def __init__(self, flush_size=HISTORY_FLUSH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL,
+                 max_attempts=HISTORY_MAX_FLUSH_ATTEMPTS, max_pending=HISTORY_MAX_PENDING):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self._pending = []
+        self._repeats = []  # Folded repeats: counted in the summaries, not written as history rows
+        self._last_query = {}  # user_id -> (normalized query, pending event), until the next flush
+        self._failed = None  # (events, repeats, attempts) of the batch that last failed to write
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._app = None
+        self._thread = None
+
+    def record(self, user_id, search_query):
+        """Buffer a search for a user. Returns False if it was folded into the previous one."""
+        key = normalize_query(search_query)
+        now = datetime.utcnow()
+
+        with self._lock:
+            last = self._last_query.get(user_id)
+            if last is not None and last[0] == key:
+                last[1]["search_date"] = now
+                self._repeats.append({"user_id": user_id, "search_query": search_query, "search_date": now})
+                return False
+
+            event = {"user_id": user_id, "search_query": search_query, "search_date": now}
+            self._pending.append(event)
+            self._last_query[user_id] = (key, event)
+            full = len(self._pending) >= self.flush_size
+            dropped = self._trim()
+
+        if dropped:
+            current_app.logger.warning("Search history buffer is full; dropped %d oldest events", dropped)
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Write all pending events in one bulk insert. Needs an app context."""
+        with self._flush_lock:
+            if self._failed is not None:
+                failed, self._failed = self._failed, None
+                try:
+                    self._write(failed[0], failed[1])
+                except Exception:
+                    if not self._give_up(failed):
+                        raise  # Newer events stay buffered behind the failed batch
+
+            with self._lock:
+                events, self._pending = self._pending, []
+                repeats, self._repeats = self._repeats, []
+                self._last_query.clear()  # Flushed events can no longer be folded into
+            if not events and not repeats:
+                return 0
+
+            try:
+                self._write(events, repeats)
+            except Exception:
+                if not self._give_up((events, repeats, 0)):
+                    raise
+                return 0
+            return len(events)
+
+    def _write(self, events, repeats):
+        try:
+            if events:
+                db.session.execute(insert(SearchHistory), events)
+            update_summaries(events + repeats)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _give_up(self, failed):
+        """
+        Count a failed write of a batch. Returns True if the batch was dropped, False if
+        it is kept to be retried on the next flush.
+        """
+        events, repeats, attempts = failed
+        attempts += 1
+        if attempts < self.max_attempts:
+            self._failed = (events, repeats, attempts)
+            return False
+        current_app.logger.exception(
+            "Dropping %d search history events and %d repeats after %d failed writes",
+            len(events), len(repeats), attempts,
+        )
+        return True
+
+    def _trim(self):
+        """Drop the oldest buffered events beyond max_pending. Call with _lock held."""
+        dropped = 0
+        for buffered in (self._pending, self._repeats):
+            excess = len(buffered) - self.max_pending
+            if excess > 0:
+                del buffered[:excess]
+                dropped += excess
+        return dropped
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = current_app._get_current_object()
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception:
+                self._app.logger.exception("Flushing search history failed")
+
+    def shutdown(self):
+        """Stop the writer thread and flush whatever is still buffered."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        if self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+
+history_buffer = HistoryBuffer()
@@ -0,0 +1,256 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from model import SmsOutbox, db
+
+# Messages claimed per dispatch round
+SMS_BATCH_SIZE = int(os.getenv("SMS_BATCH_SIZE", "100"))
+
+# Idle time between polls when the outbox is empty (new messages also wake the dispatcher)
+SMS_POLL_INTERVAL = float(os.getenv("SMS_POLL_INTERVAL", "5"))
+
+# Retry policy: exponential backoff from SMS_RETRY_BASE seconds, capped at SMS_RETRY_MAX
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "5"))
+SMS_RETRY_BASE = float(os.getenv("SMS_RETRY_BASE", "2"))
+SMS_RETRY_MAX = float(os.getenv("SMS_RETRY_MAX", "300"))
+
+# Gateway calls in flight at once; each distinct message text needs its own call
+SMS_SEND_CONCURRENCY = int(os.getenv("SMS_SEND_CONCURRENCY", "8"))
+
+# A claimed message not finished within this many seconds is picked up again
+SMS_CLAIM_TIMEOUT = int(os.getenv("SMS_CLAIM_TIMEOUT", "60"))
+
+# Africa's Talking per-recipient status codes that mean the message was accepted
+SUCCESS_STATUS_CODES = {100, 101, 102}
+
+
+_sdk_lock = threading.Lock()
+
+
+def sms_service():
+    """
+    africastalking.SMS, importing and initializing the SDK from the app config on
+    first use so processes that never send SMS don't pay for it. Needs an app context.
+    """
+    import africastalking
+    if africastalking.SMS is None:
+        with _sdk_lock:
+            if africastalking.SMS is None:
+                africastalking.initialize(
+                    username=current_app.config.get('AFRICASTALKING_USERNAME'),
+                    api_key=current_app.config.get('AFRICASTALKING_API_KEY'),
+                )
+    return africastalking.SMS
+
+
+def enqueue_sms(phone_number, message):
+    """
+    Queue an SMS in the current transaction. It is sent once the caller commits,
+    so the message is never lost and never sent for a rolled-back request.
+    """
+    entry = SmsOutbox(phone_number=str(phone_number), message=message)
+    db.session.add(entry)
+    return entry
+
+
+def backoff_delay(attempts, base=SMS_RETRY_BASE, cap=SMS_RETRY_MAX):
+    """Exponential backoff with jitter for the given (1-based) attempt count."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+
+
+def _normalize_number(number):
+    return str(number).lstrip('+')
+
+
+class FakeSmsGateway:
+    """
+    Offline stand-in for africastalking.SMS with configurable latency and failures.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, recipient_failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.recipient_failure_rate = recipient_failure_rate
+        self.calls = 0
+        self.sent = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, message, recipients):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise RuntimeError("Gateway unavailable")
+
+        results = []
+        for number in recipients:
+            delivered = self._random.random() >= self.recipient_failure_rate
+            if delivered:
+                with self._lock:
+                    self.sent.append((number, message))
+            results.append({
+                "number": number,
+                "status": "Success" if delivered else "InvalidPhoneNumber",
+                "statusCode": 101 if delivered else 403,
+            })
+        return {"SMSMessageData": {"Message": f"Sent to {len(recipients)}", "Recipients": results}}
+
+
+class SmsDispatcher:
+    """
+    Background thread that drains the SMS outbox.
+
+    Due messages are claimed in batches. Recipients of the same text share one gateway
+    call; distinct texts (e.g. reset codes) are sent concurrently, up to
+    SMS_SEND_CONCURRENCY calls at a time. Failures are retried with exponential
+    backoff until SMS_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, gateway=None, batch_size=SMS_BATCH_SIZE, poll_interval=SMS_POLL_INTERVAL,
+                 max_attempts=SMS_MAX_ATTEMPTS, concurrency=SMS_SEND_CONCURRENCY):
+        self._gateway = gateway
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self._executor = None
+        self._app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def gateway(self):
+        # Resolved lazily: the SDK is only initialized once something is sent
+        return self._gateway or sms_service()
+
+    def ensure_started(self, app):
+        """Start the dispatcher thread for this app if it is not running yet."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._app = app
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='sms-dispatcher', daemon=True)
+            self._thread.start()
+
+    def run(self, app):
+        """Drain the outbox in the calling thread until stop(), for a dedicated worker process."""
+        self._app = app
+        self._stopped.clear()
+        self._run()
+
+    def wake(self):
+        """Tell the dispatcher that new messages are waiting."""
+        self._wakeup.set()
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with self._app.app_context():
+                    sent = self.dispatch_once()
+            except Exception:
+                self._app.logger.exception("SMS dispatch failed")
+                sent = 0
+            if not sent:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        """Lease a batch of due messages so concurrent dispatchers skip them."""
+        now = datetime.utcnow()
+        candidates = (
+            db.session.query(SmsOutbox.id)
+            .filter(SmsOutbox.status.in_(('pending', 'sending')), SmsOutbox.next_attempt_at <= now)
+            .order_by(SmsOutbox.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        ids = [row.id for row in candidates]
+        if not ids:
+            db.session.commit()
+            return []
+
+        # The lease expiry doubles as a claim marker: only rows we updated carry it
+        lease = now + timedelta(seconds=SMS_CLAIM_TIMEOUT)
+        db.session.execute(
+            update(SmsOutbox)
+            .where(SmsOutbox.id.in_(ids), SmsOutbox.next_attempt_at <= now)
+            .values(status='sending', next_attempt_at=lease)
+        )
+        db.session.commit()
+        return SmsOutbox.query.filter(SmsOutbox.id.in_(ids), SmsOutbox.next_attempt_at == lease).all()
+
+    def dispatch_once(self):
+        """Send one batch of due messages. Returns the number of messages processed."""
+        entries = self._claim()
+        if not entries:
+            return 0
+
+        by_message = {}
+        for entry in entries:
+            by_message.setdefault(entry.message, []).append(entry)
+
+        # Gateway calls run on the pool; the session is only touched from this thread
+        gateway = self.gateway
+        sends = [
+            (group, self._send_pool().submit(gateway.send, message, [entry.phone_number for entry in group]))
+            for message, group in by_message.items()
+        ]
+
+        now = datetime.utcnow()
+        for group, future in sends:
+            try:
+                response = future.result()
+                recipients = response.get("SMSMessageData", {}).get("Recipients", [])
+                statuses = {_normalize_number(r.get("number")): r for r in recipients}
+                error = None
+            except Exception as e:
+                statuses, error = {}, str(e)
+
+            for entry in group:
+                entry.attempts += 1
+                result = statuses.get(_normalize_number(entry.phone_number))
+                if result is not None and result.get("statusCode") in SUCCESS_STATUS_CODES:
+                    entry.status = 'sent'
+                    entry.sent_at = now
+                    entry.last_error = None
+                    continue
+
+                entry.last_error = (error or (result or {}).get("status") or "No status returned")[:255]
+                if entry.attempts >= self.max_attempts:
+                    entry.status = 'failed'
+                else:
+                    entry.status = 'pending'
+                    entry.next_attempt_at = now + timedelta(seconds=backoff_delay(entry.attempts))
+
+        db.session.commit()
+        return len(entries)
+
+    def _send_pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max(1, self.concurrency), thread_name_prefix='sms-send')
+        return self._executor
+
+
+sms_dispatcher = SmsDispatcher()
@@ -0,0 +1,68 @@
+import os
+from flask import Response, current_app, request, stream_with_context
+
+from model import db
+
+# Rows fetched from the database cursor (and written to the client) per batch
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_FORMATS = ('ndjson', 'json')
+
+
+def stream_format():
+    """
+    Return the streaming format requested by the client ('ndjson' or 'json'), or None.
+    Streaming is opt-in via ?stream=ndjson|json or an Accept: application/x-ndjson header.
+    """
+    requested = request.args.get('stream')
+    if requested in STREAM_FORMATS:
+        return requested
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return None
+
+
+def iter_rows(statement, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield rows of a select() as dicts, fetching them from a server-side cursor in
+    batches of batch_size so only one batch is ever held in memory.
+    """
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        for row in partition:
+            yield dict(row._mapping)
+
+
+def _chunks(rows, fmt, batch_size):
+    dumps = current_app.json.dumps
+    batch = []
+    first = True
+
+    if fmt == 'json':
+        yield '['
+    for row in rows:
+        if fmt == 'ndjson':
+            batch.append(dumps(row) + '\n')
+        else:
+            batch.append(dumps(row) if first else ',' + dumps(row))
+            first = False
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+    if fmt == 'json':
+        yield ']'
+
+
+def stream_response(rows, fmt='ndjson', batch_size=STREAM_BATCH_SIZE):
+    """
+    Build a streamed response from an iterable of dicts.
+
+    The body is generated lazily: the WSGI server only pulls the next batch once the
+    previous one has been written to the client, so a slow reader holds back the
+    database cursor instead of piling rows up in memory.
+    """
+    mimetype = NDJSON_MIMETYPE if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(_chunks(rows, fmt, batch_size)), mimetype=mimetype)
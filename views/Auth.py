@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt
 from model import User, db
+from services.auth_cache import issue_token, revoke_token
+from services.passwords import PasswordServiceBusy
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -20,8 +21,11 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({"message": "Email already registered"}), 400
 
-    hashed_password = generate_password_hash(password)
-    new_user = User(username=username, email=email, password_hash=hashed_password)
+    new_user = User(username=username, email=email)
+    try:
+        new_user.set_password(password)
+    except PasswordServiceBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503
 
     try:
         db.session.add(new_user)
@@ -44,13 +48,27 @@ def login():
         return jsonify({"message": "Missing email or password"}), 400
 
     user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
-        return jsonify({"message": "Invalid credentials"}), 401
-
-    access_token = create_access_token(identity=user.id)
+    try:
+        if not user or not user.check_password(password):
+            return jsonify({"message": "Invalid credentials"}), 401
+    except PasswordServiceBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503
+
+    # Record the token so it can be revoked; the commit also persists an upgraded password hash
+    access_token = issue_token(user.id)
+    db.session.commit()
     return jsonify(access_token=access_token), 200
 
 
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    # Revoke the token presented with this request
+    revoke_token(get_jwt())
+    db.session.commit()
+    return jsonify({"message": "Logged out"}), 200
+
+
 @auth_bp.route('/social-login', methods=['POST'])
 def social_login():
     data = request.json
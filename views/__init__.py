@@ -1,7 +0,0 @@
-from .user import *
-from .Auth import *
-from .filtering_sorting import *
-from .payment import *
-from .product import *
-from .search import *
-from .africastalking_setup import *
\ No newline at end of file
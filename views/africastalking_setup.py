@@ -1,26 +1,27 @@
 import random
 import string
 from datetime import datetime, timedelta
-from flask import jsonify
-import africastalking
+from flask import current_app, jsonify
 from model import db
 from model import PasswordReset
 from flask_jwt_extended import jwt_required
-
-# Africa's Talking Setup (do not re-initialize here, it should be done in app.py)
-sms = africastalking.SMS
+from services.sms_outbox import enqueue_sms, sms_dispatcher, sms_service
 
 # Generate reset token
 def generate_reset_token(length=6):
     """Generate a random token for password reset."""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
+def reset_message(token):
+    return f"Your password reset token is: {token}. It expires in 10 minutes."
+
 # Send SMS with reset token
 def send_sms(phone_number, token):
-    """Send the reset token to the user's phone number."""
-    message = f"Your password reset token is: {token}. It expires in 10 minutes."
+    """Send the reset token to the user's phone number right away (bypasses the outbox)."""
+    message = reset_message(token)
     try:
-        response = sms.send(message, [phone_number])
+        # Africa's Talking is initialized on first use (see sms_service)
+        response = sms_service().send(message, [phone_number])
         return response
     except Exception as e:
         return {"error": str(e)}
@@ -36,14 +37,14 @@ def request_password_reset(phone_number, user_id):
     token = generate_reset_token()
     expiration_time = datetime.utcnow() + timedelta(minutes=10)  # Token expires in 10 minutes
 
-    # Save the reset token in the database
+    # Save the reset token and queue its SMS in the same transaction
     password_reset = PasswordReset(user_id=user_id, token=token, expiration=expiration_time)
     db.session.add(password_reset)
+    enqueue_sms(phone_number, reset_message(token))
     db.session.commit()
 
-    # Send the reset token via SMS
-    response = send_sms(phone_number, token)
-    if "error" in response:
-        return jsonify({"message": "Failed to send SMS", "error": response["error"]}), 500
+    # The background dispatcher sends (and retries) the SMS; don't wait for the gateway
+    sms_dispatcher.ensure_started(current_app._get_current_object())
+    sms_dispatcher.wake()
 
-    return jsonify({"message": "Password reset token sent successfully"}), 200
+    return jsonify({"message": "Password reset token sent successfully"}), 202
@@ -1,41 +1,231 @@
+import time
+import threading
+from collections import OrderedDict
 from flask import Blueprint, request, jsonify
-from model import FilterPreference, db
-from sqlalchemy.sql import text
+from model import FilterPreference, Product, db
+from sqlalchemy import func, select, tuple_
+from services.db_routing import read_only
+from services.ingest import insert_for
+from services.pagination import decode_cursor, encode_cursor
+from services.streaming import iter_rows, stream_format, stream_response
 
 filter_bp = Blueprint('filter', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Maximum number of users whose compiled filter plans are kept in memory
+MAX_CACHED_PLANS = 10000
+
+# Cached plans are reloaded after this many seconds so changes made through other workers show up
+PLAN_TTL = 60
+
+# Request parameters that override stored preferences (anything else reuses the cached plan)
+OVERRIDE_PARAMS = ('sort', 'order', 'min_price', 'max_price', 'min_rating', 'shop', 'payment_mode')
+
+# Sortable keys; each has a matching (expression, id) index on products
+SORT_COLUMNS = {
+    'price': Product.product_price,
+    'rating': func.coalesce(Product.product_rating, 0.0),
+}
+
+# Only the columns the listing needs are loaded
+LISTING_COLUMNS = (
+    Product.id,
+    Product.product_name,
+    Product.product_price,
+    Product.product_rating,
+    Product.num_ratings,
+    Product.product_url,
+    Product.delivery_cost,
+    Product.shop_name,
+    Product.payment_mode,
+)
+
+
+def build_filters(options):
+    """Translate filter options into SQL conditions, all answered from indexed columns."""
+    filters = []
+    if options.get('min_price'):
+        filters.append(Product.product_price >= float(options['min_price']))
+    if options.get('max_price'):
+        filters.append(Product.product_price <= float(options['max_price']))
+    if options.get('min_rating'):
+        filters.append(Product.product_rating >= float(options['min_rating']))
+    if options.get('shop'):
+        filters.append(Product.shop_name == options['shop'])
+    if options.get('payment_mode'):
+        filters.append(Product.payment_mode == options['payment_mode'])
+    return filters
+
+
+class FilterPlan:
+    """
+    A user's preferences compiled into a ready-to-run listing query.
+    """
+    __slots__ = ('sort_key', 'descending', 'sort_column', 'statement')
+
+    def __init__(self, sort_key, descending, filters):
+        self.sort_key = sort_key
+        self.descending = descending
+        self.sort_column = SORT_COLUMNS[sort_key]
+
+        statement = select(*LISTING_COLUMNS).where(*filters)
+        if descending:
+            self.statement = statement.order_by(self.sort_column.desc(), Product.id.desc())
+        else:
+            self.statement = statement.order_by(self.sort_column.asc(), Product.id.asc())
+
+    def after(self, cursor):
+        """Return the statement for every row after `cursor`."""
+        if cursor is None:
+            return self.statement
+        position = tuple_(self.sort_column, Product.id)
+        return self.statement.where(position < tuple_(*cursor) if self.descending else position > tuple_(*cursor))
+
+    def page(self, cursor, limit):
+        """Return the statement for the page after `cursor` (fetching one extra row)."""
+        return self.after(cursor).limit(limit + 1)
+
+    def cursor_for(self, product):
+        if self.sort_key == 'rating':
+            return encode_cursor(product['product_rating'] or 0.0, product['id'])
+        return encode_cursor(product['product_price'], product['id'])
+
+
+def compile_plan(preferences, overrides=None):
+    """
+    Build a FilterPlan from stored preferences plus optional request overrides.
+    Raises ValueError for unsupported sort keys or malformed filter values.
+    """
+    options = dict(preferences, **(overrides or {}))
+
+    # The first sort preference wins; id breaks ties so the cursor is unique
+    sort_key = options.get('sort') or next((key for key in SORT_COLUMNS if key in preferences), 'price')
+    if sort_key not in SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort key. Use one of: {', '.join(SORT_COLUMNS)}")
+    descending = options.get('order', preferences.get(sort_key)) == 'descending'
+    return FilterPlan(sort_key, descending, build_filters(options))
+
+
+class PreferenceCache:
+    """
+    In-process cache of each user's preferences and compiled FilterPlan.
+
+    Entries are loaded on first use and kept up to date by set_preference (write-through),
+    so listing requests never have to read FilterPreference or rebuild the query. The TTL
+    only bounds staleness for changes written by other worker processes.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_PLANS, ttl=PLAN_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return (preferences, plan) for a user, loading them from the database on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[2] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry[:2]
+
+        preferences = {pref.preference_key: pref.preference_value
+                       for pref in FilterPreference.query.filter_by(user_id=user_id).all()}
+        return self._store(user_id, preferences)
+
+    def set(self, user_id, preference_key, preference_value):
+        """Write-through: apply a committed preference change to the cached entry."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            return  # Not cached here; loaded fresh on the next read
+        preferences = dict(entry[0])
+        preferences[preference_key] = preference_value
+        self._store(user_id, preferences)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _store(self, user_id, preferences):
+        try:
+            plan = compile_plan(preferences)
+        except ValueError:
+            # A bad stored value should not break listings; fall back to the default plan
+            plan = compile_plan({})
+        entry = (preferences, plan, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry[:2]
+
+
+preference_cache = PreferenceCache()
+
 @filter_bp.route('/set-preference', methods=['POST'])
 def set_preference():
     """
     Set or update a user's filter preferences.
     """
-    data = request.json
+    data = request.json or {}
     user_id = data.get('user_id')  # The user ID is passed in the request
     preference_key = data.get('key')
     preference_value = data.get('value')
 
-    # Validate incoming data
+    # Validate incoming data before anything is written
     if not user_id or not preference_key or not preference_value:
         return jsonify({"message": "User ID, preference key, and preference value are required"}), 400
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return jsonify({"message": "User ID must be a number"}), 400
+    if not isinstance(preference_key, str) or not isinstance(preference_value, str):
+        return jsonify({"message": "Preference key and value must be strings"}), 400
 
-    # Check if preference already exists in the database
-    preference = FilterPreference.query.filter_by(user_id=user_id, preference_key=preference_key).first()
-
-    if preference:
-        preference.preference_value = preference_value  # Update the preference
-    else:
-        # Add a new preference if not found
-        preference = FilterPreference(user_id=user_id, preference_key=preference_key, preference_value=preference_value)
-        db.session.add(preference)
+    # Reject values that would not compile into a plan, e.g. sort="foo" or min_price="abc"
+    preferences, _ = preference_cache.get(user_id)
+    try:
+        compile_plan(dict(preferences, **{preference_key: preference_value}))
+    except ValueError as e:
+        return jsonify({"message": "Invalid preference value", "error": str(e)}), 400
 
+    # Insert or update the preference in a single statement
+    stmt = insert_for(FilterPreference).values(
+        user_id=user_id, preference_key=preference_key, preference_value=preference_value
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'preference_key'],
+        set_={'preference_value': stmt.excluded.preference_value},
+    )
+    db.session.execute(stmt)
     db.session.commit()
+
+    # Keep the cached plan in step with the database
+    preference_cache.set(user_id, preference_key, preference_value)
+
     return jsonify({"message": "Preference updated successfully"}), 200
 
 
 @filter_bp.route('/apply-filters', methods=['GET'])
+@read_only
 def apply_filters():
     """
-    Apply filter preferences and sort the products accordingly.
+    Apply filter preferences and return one page of products, sorted accordingly.
+
+    Pages are fetched with a keyset cursor on (sort key, id), so every page costs the
+    same regardless of how deep it is. Query parameters override stored preferences:
+    sort (price|rating), order (ascending|descending), min_price, max_price,
+    min_rating, shop, payment_mode, limit and cursor.
+
+    With ?stream=ndjson (or json) every matching row after the cursor is streamed
+    instead, up to `limit` if one is given.
     """
     data = request.args  # Query parameters are used for filtering
     user_id = data.get('user_id')
@@ -44,27 +234,30 @@ def apply_filters():
     if not user_id:
         return jsonify({"message": "User ID is required"}), 400
 
-    # Fetch user preferences from the database
-    preferences = FilterPreference.query.filter_by(user_id=user_id).all()
-
-    # Initialize the base SQL query
-    query = text("SELECT * FROM products")
+    try:
+        user_id = int(user_id)
+        limit = max(1, min(int(data.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        cursor = decode_cursor(data['cursor'], float, int) if data.get('cursor') else None
 
-    # Define a dictionary to map preference values to SQL sort directions
-    sort_map = {
-        'ascending': 'ASC',
-        'descending': 'DESC'
-    }
+        # Cached preferences and plan; request parameters take precedence
+        preferences, plan = preference_cache.get(user_id)
+        overrides = {key: data[key] for key in OVERRIDE_PARAMS if key in data}
+        if overrides:
+            plan = compile_plan(preferences, overrides)
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": "Invalid filter, limit or cursor value", "error": str(e)}), 400
 
-    # Apply filters dynamically based on user preferences
-    for pref in preferences:
-        if pref.preference_key in ['price', 'rating']:
-            # Get the sort order from the map, default to 'ASC' if invalid
-            sort_order = sort_map.get(pref.preference_value, 'ASC')
-            query = query.order_by(text(f"{pref.preference_key} {sort_order}"))
+    # Streaming mode: rows go straight from the database cursor to the client
+    fmt = stream_format()
+    if fmt:
+        statement = plan.after(cursor)
+        if 'limit' in data:
+            statement = statement.limit(limit)
+        return stream_response(iter_rows(statement), fmt)
 
-    # Execute the query and fetch results
-    results = db.session.execute(query).fetchall()
+    # Fetch one extra row to know whether there is a next page
+    rows = db.session.execute(plan.page(cursor, limit)).fetchall()
+    products = [dict(row._mapping) for row in rows[:limit]]
+    next_cursor = plan.cursor_for(products[-1]) if len(rows) > limit else None
 
-    # Return the results as a list of dictionaries
-    return jsonify([dict(row) for row in results]), 200
+    return jsonify({"products": products, "next_cursor": next_cursor}), 200
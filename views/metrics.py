@@ -0,0 +1,69 @@
+import hmac
+from functools import wraps
+from flask import Blueprint, current_app, jsonify, request
+from services.db_profiles import pool_stats
+from services.instrumentation import instrumentation
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def ops_only(view):
+    """
+    Require the METRICS_ADMIN_TOKEN in an X-Ops-Token header. Without a configured
+    token the endpoint is disabled.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config.get('METRICS_ADMIN_TOKEN')
+        if not expected:
+            return jsonify({"message": "Set METRICS_ADMIN_TOKEN to enable this endpoint"}), 403
+        if not hmac.compare_digest(request.headers.get('X-Ops-Token', '').encode(), expected.encode()):
+            return jsonify({"message": "A valid X-Ops-Token header is required"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@metrics_bp.route('/metrics/db-pool', methods=['GET'])
+def db_pool_metrics():
+    """
+    Connection pool size and event counters for each database engine.
+    """
+    return jsonify(pool_stats(current_app)), 200
+
+
+@metrics_bp.route('/metrics/db-replicas', methods=['GET'])
+def db_replica_metrics():
+    """
+    Health, lag and routed reads of each read replica, plus reads that fell back to the primary.
+    """
+    replicas = current_app.extensions.get('db_replicas')
+    return jsonify(replicas.snapshot() if replicas is not None else {"replicas": {}}), 200
+
+
+@metrics_bp.route('/metrics/latency', methods=['GET'])
+def latency_metrics():
+    """
+    Latency histograms (percentiles in ms) per endpoint, per span (crawl, ingest, rank, serialize) and for SQL.
+    """
+    return jsonify(instrumentation.snapshot()), 200
+
+
+@metrics_bp.route('/metrics/latency', methods=['DELETE'])
+@ops_only
+def reset_latency_metrics():
+    instrumentation.reset()
+    return jsonify({"message": "Latency metrics reset"}), 200
+
+
+@metrics_bp.route('/metrics/sampling', methods=['PUT'])
+@ops_only
+def set_sampling():
+    """
+    Change the share of requests that are instrumented, e.g. {"rate": 0.05}; 0 turns it off.
+    """
+    rate = (request.json or {}).get('rate')
+    try:
+        instrumentation.set_sample_rate(rate)
+    except (TypeError, ValueError):
+        return jsonify({"message": "rate must be a number between 0 and 1"}), 400
+    return jsonify({"sample_rate": instrumentation.sample_rate}), 200
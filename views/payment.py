@@ -1,10 +1,15 @@
 from flask import Blueprint, request, jsonify
-from model import db, Product
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.db_routing import read_only
+from services.product_cache import product_summaries
 
 payment_bp = Blueprint('payment', __name__)
 
+# Most line items priced in one /calculate-total-cost/batch request
+MAX_CART_ITEMS = 200
+
 @payment_bp.route('/calculate-total-cost', methods=['POST'])
+@read_only
 @jwt_required()
 def calculate_total_cost():
     """
@@ -16,19 +21,69 @@ def calculate_total_cost():
     if not product_id:
         return jsonify({"message": "Product ID is required"}), 400
 
-    # Fetch product details from the database
-    product = Product.query.filter_by(id=product_id).first()
+    # Fetch product details (served from the product summary cache)
+    try:
+        product = product_summaries.get(int(product_id))
+    except (TypeError, ValueError):
+        return jsonify({"message": "Product ID must be a number"}), 400
     if not product:
         return jsonify({"message": "Product not found"}), 404
 
-    # Calculate total cost (product price + delivery cost)
-    total_cost = product.product_price + product.delivery_cost
-
     return jsonify({
         "product_name": product.product_name,
         "product_price": product.product_price,
         "delivery_cost": product.delivery_cost,
-        "total_cost": total_cost
+        "total_cost": product.total_cost
+    }), 200
+
+
+@payment_bp.route('/calculate-total-cost/batch', methods=['POST'])
+@read_only
+@jwt_required()
+def calculate_cart_cost():
+    """
+    Calculate the total cost of a whole cart: {"items": [{"product_id": 1, "quantity": 2}, ...]}.
+    Every product is looked up at once.
+    """
+    items = (request.json or {}).get('items')
+    if not items or not isinstance(items, list):
+        return jsonify({"message": "Items are required"}), 400
+    if len(items) > MAX_CART_ITEMS:
+        return jsonify({"message": f"At most {MAX_CART_ITEMS} items per request"}), 400
+
+    try:
+        lines = [(int(item['product_id']), int(item.get('quantity', 1))) for item in items]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"message": "Each item needs a numeric product_id and quantity"}), 400
+    if any(quantity < 1 for _, quantity in lines):
+        return jsonify({"message": "Quantities must be at least 1"}), 400
+
+    products = product_summaries.get_many([product_id for product_id, _ in lines])
+    missing = sorted({product_id for product_id, _ in lines if product_id not in products})
+    if missing:
+        return jsonify({"message": "Products not found", "product_ids": missing}), 404
+
+    results = []
+    subtotal = delivery = 0.0
+    for product_id, quantity in lines:
+        product = products[product_id]
+        line_price = product.product_price * quantity
+        subtotal += line_price
+        delivery += product.delivery_cost
+        results.append({
+            "product_id": product_id,
+            "product_name": product.product_name,
+            "quantity": quantity,
+            "product_price": product.product_price,
+            "delivery_cost": product.delivery_cost,
+            "total_cost": line_price + product.delivery_cost,
+        })
+
+    return jsonify({
+        "items": results,
+        "subtotal": subtotal,
+        "delivery_cost": delivery,
+        "total_cost": subtotal + delivery
     }), 200
 
 
@@ -45,8 +100,11 @@ def process_payment():
     if not product_id or not payment_mode:
         return jsonify({"message": "Product ID and Payment Mode are required"}), 400
 
-    # Fetch product details from the database
-    product = Product.query.filter_by(id=product_id).first()
+    # Charge the current price: read from the primary, never from the display cache
+    try:
+        product = product_summaries.fresh(int(product_id))
+    except (TypeError, ValueError):
+        return jsonify({"message": "Product ID must be a number"}), 400
     if not product:
         return jsonify({"message": "Product not found"}), 404
 
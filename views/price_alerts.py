@@ -0,0 +1,88 @@
+import math
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from model import PriceAlert, db
+from services.db_routing import read_only
+from services.price_alerts import alert_engine
+from services.search_cache import normalize_query
+
+price_alerts_bp = Blueprint('price_alerts', __name__)
+
+MAX_ALERTS_PER_USER = 50
+
+
+def parse_threshold(data, key):
+    value = data.get(key)
+    if value is None:
+        return None
+    value = float(value)
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(key)
+    return value
+
+
+@price_alerts_bp.route('/price-alerts', methods=['GET'])
+@read_only
+@jwt_required()
+def list_price_alerts():
+    """List the user's price alerts."""
+    user_id = get_jwt_identity()
+    alerts = PriceAlert.query.filter_by(user_id=user_id, active=True).order_by(PriceAlert.id).all()
+    return jsonify({"alerts": [alert.to_dict() for alert in alerts]}), 200
+
+
+@price_alerts_bp.route('/price-alerts', methods=['POST'])
+@jwt_required()
+def save_price_alert():
+    """
+    Create or update the user's alert for a search query.
+
+    Body: {"query": ..., "max_price": ..., "min_drop_percent": ...}; both thresholds
+    are optional, and without either the alert fires on the default percentage drop.
+    Queries searched repeatedly are watched on the default drop even without an alert.
+    """
+    user_id = get_jwt_identity()
+    data = request.json or {}
+    query = normalize_query(data.get('query') or '')
+    if not query:
+        return jsonify({"message": "Query is required"}), 400
+    if len(query) > 255:
+        return jsonify({"message": "Query is too long"}), 400
+    try:
+        max_price = parse_threshold(data, 'max_price')
+        min_drop_percent = parse_threshold(data, 'min_drop_percent')
+    except (TypeError, ValueError):
+        return jsonify({"message": "max_price and min_drop_percent must be positive numbers"}), 400
+
+    alert = PriceAlert.query.filter_by(user_id=user_id, search_query=query).first()
+    if alert is None:
+        if PriceAlert.query.filter_by(user_id=user_id, active=True).count() >= MAX_ALERTS_PER_USER:
+            return jsonify({"message": f"At most {MAX_ALERTS_PER_USER} price alerts per user"}), 400
+        alert = PriceAlert(user_id=user_id, search_query=query)
+        db.session.add(alert)
+        status = 201
+    else:
+        alert_engine.alert_removed(alert)
+        status = 200
+    alert.max_price = max_price
+    alert.min_drop_percent = min_drop_percent
+    alert.active = True
+    db.session.commit()
+
+    alert_engine.alert_added(alert)
+    return jsonify(alert.to_dict()), status
+
+
+@price_alerts_bp.route('/price-alerts/<int:alert_id>', methods=['DELETE'])
+@jwt_required()
+def delete_price_alert(alert_id):
+    """Delete one of the user's price alerts."""
+    user_id = get_jwt_identity()
+    alert = PriceAlert.query.filter_by(id=alert_id, user_id=user_id).first()
+    if alert is None:
+        return jsonify({"message": "Price alert not found"}), 404
+
+    alert_engine.alert_removed(alert)
+    db.session.delete(alert)
+    db.session.commit()
+    return jsonify({"message": "Price alert deleted"}), 200
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, request, jsonify
+from sqlalchemy import Integer, cast, func, select
+from model import PriceHistory, db
+from services.db_routing import read_only
+
+price_history_bp = Blueprint('price_history', __name__)
+
+DEFAULT_WINDOW_DAYS = 30
+DEFAULT_BUCKETS = 50
+MAX_BUCKETS = 500
+
+
+def epoch_seconds(column):
+    """SQL expression for a DateTime column as seconds since the epoch."""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return (func.julianday(column) - 2440587.5) * 86400.0
+    return func.extract('epoch', column)
+
+
+def parse_date(value, default):
+    """
+    Parse an ISO 8601 date into naive UTC, the way change_date is stored.
+    Offsets (including a trailing Z) are converted to UTC. Raises ValueError
+    (or OverflowError for offsets that push the date out of range).
+    """
+    if not value:
+        return default
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@price_history_bp.route('/price-history/<int:product_id>', methods=['GET'])
+@read_only
+def get_price_history(product_id):
+    """
+    Summarize a product's price changes over a time window.
+
+    Returns min/max/avg over the window plus a series downsampled into at most
+    `buckets` equal-width buckets. Query parameters: start, end (ISO 8601, default the
+    last 30 days) and buckets. The query is answered from the
+    (product_id, change_date, new_price) index alone.
+    """
+    try:
+        end = parse_date(request.args.get('end'), datetime.utcnow())
+        start = parse_date(request.args.get('start'), end - timedelta(days=DEFAULT_WINDOW_DAYS))
+        buckets = max(1, min(int(request.args.get('buckets', DEFAULT_BUCKETS)), MAX_BUCKETS))
+    except (ValueError, OverflowError):
+        return jsonify({"message": "start/end must be ISO 8601 dates and buckets an integer"}), 400
+    if start >= end:
+        return jsonify({"message": "start must be before end"}), 400
+
+    in_window = (
+        PriceHistory.product_id == product_id,
+        PriceHistory.change_date >= start,
+        PriceHistory.change_date < end,
+    )
+
+    # One grouped pass over the index; the window summary is folded from the buckets
+    width = (end - start).total_seconds() / buckets
+    start_epoch = (start - datetime(1970, 1, 1)).total_seconds()
+    bucket = cast((epoch_seconds(PriceHistory.change_date) - start_epoch) / width, Integer).label('bucket')
+    rows = db.session.execute(
+        select(bucket, func.count(), func.min(PriceHistory.new_price), func.max(PriceHistory.new_price),
+               func.avg(PriceHistory.new_price)).where(*in_window).group_by(bucket).order_by(bucket)
+    ).fetchall()
+
+    series = [
+        {
+            "bucket_start": (start + timedelta(seconds=index * width)).isoformat(),
+            "count": bucket_count,
+            "min": bucket_min,
+            "max": bucket_max,
+            "avg": bucket_avg,
+        }
+        for index, bucket_count, bucket_min, bucket_max, bucket_avg in rows
+    ]
+    count = sum(point["count"] for point in series)
+
+    return jsonify({
+        "product_id": product_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "count": count,
+        "min": min(point["min"] for point in series) if series else None,
+        "max": max(point["max"] for point in series) if series else None,
+        "avg": sum(point["avg"] * point["count"] for point in series) / count if count else None,
+        "series": series,
+    }), 200
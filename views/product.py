@@ -1,64 +1,109 @@
 from flask import Blueprint, request, jsonify
-from model import Product, RankedProduct, db
+from model import db
+from services.clustering import group_by_cluster
+from services.crawler import crawl_shops
+from services.fulltext import product_index
+from services.ingest import upsert_products
+from services.instrumentation import span
+from services.ranking import ranked_offers, update_rankings
+from services.rate_limit import CRAWL_LIMIT, SEARCH_IP_LIMIT, SEARCH_USER_LIMIT
+from services.rate_limit import RateLimited, rate_limited, rate_limiter, too_many_requests
+from services.search_cache import normalize_query, search_cache
+from services.streaming import stream_format, stream_response
 
 product_bp = Blueprint('product', __name__)
 
-def calculate_mb_cb_scores(product):
+# Number of ranked results returned (and cached) per query
+SEARCH_RESULT_LIMIT = 100
+
+def run_search(query):
     """
-    Calculates MB (Marketability) and CB (Customer Benefit) scores for a product.
+    Crawl the shops for a query, save the listings and rank them.
+    Returns (ranked results as dicts, CrawlResult). Raises RateLimited when the
+    global crawl budget is spent.
     """
-    # Example calculation (you can adjust this logic)
-    mb_score = product['product_rating'] * 10 + product['num_ratings'] / 10
-    cb_score = product['product_price'] / product['delivery_cost']
-    return mb_score, cb_score
+    rate_limiter.check('crawl:all', CRAWL_LIMIT)
+
+    # Crawl every registered shop in parallel; slow shops are dropped, not waited on
+    with span('crawl'):
+        crawl = crawl_shops(query)
+    products = crawl.products
+
+    # Save products to database in bulk and attach their ids
+    with span('ingest'):
+        product_ids = upsert_products(products)
+    for product, product_id in zip(products, product_ids):
+        product['id'] = product_id
+
+    # Rescore only the products that changed since the last crawl of this query
+    with span('rank'):
+        ranked = update_rankings(normalize_query(query), products, complete=not crawl.partial, limit=SEARCH_RESULT_LIMIT)
+        db.session.commit()
+
+    return ranked, crawl
+
+@product_bp.errorhandler(RateLimited)
+def crawl_rate_limited(exc):
+    return too_many_requests(exc.retry_after)
+
 
 @product_bp.route('/search', methods=['GET'])
+@rate_limited('search', per_user=SEARCH_USER_LIMIT, per_ip=SEARCH_IP_LIMIT)
 def search_products():
     query = request.args.get('query')
     if not query:
         return jsonify({"message": "Query parameter is required"}), 400
 
-    # Simulate crawling e-commerce APIs (e.g., Amazon, eBay, Shopify, Alibaba)
-    products = [
-        {"product_name": "Samsung A51", "product_price": 30098, "product_rating": 4.7, "num_ratings": 10, "delivery_cost": 200, "payment_mode": "Pay after delivery", "shop_name": "Jumia", "product_url": "https://jumia.com/samsung-a51"},
-        {"product_name": "Samsung A51", "product_price": 29999, "product_rating": 4.0, "num_ratings": 4, "delivery_cost": 150, "payment_mode": "Pay before delivery", "shop_name": "Kill Mall", "product_url": "https://killmall.com/samsung-a51"},
-    ]
-
-    # Save products to database
-    for product in products:
-        existing_product = Product.query.filter_by(product_name=product['product_name'], shop_name=product['shop_name']).first()
-        if not existing_product:
-            new_product = Product(
-                product_name=product['product_name'],
-                product_price=product['product_price'],
-                product_rating=product['product_rating'],
-                num_ratings=product['num_ratings'],
-                delivery_cost=product['delivery_cost'],
-                payment_mode=product['payment_mode'],
-                shop_name=product['shop_name'],
-                product_url=product['product_url']
-            )
-            db.session.add(new_product)
-    db.session.commit()
-
-    # Calculate MB/CB scores and rank products
-    ranked_products = []
-    for product in products:
-        mb_score, cb_score = calculate_mb_cb_scores(product)
-        ranked_product = RankedProduct(
-            product_id=product['id'],
-            mb_score=mb_score,
-            cb_score=cb_score,
-            rank=1  # Rank will be updated later
-        )
-        ranked_products.append(ranked_product)
-
-    # Sort by MB score descending
-    ranked_products.sort(key=lambda x: x.mb_score, reverse=True)
-    for i, rp in enumerate(ranked_products):
-        rp.rank = i + 1
-
-    db.session.add_all(ranked_products)
-    db.session.commit()
-
-    return jsonify([rp.to_dict() for rp in ranked_products]), 200
+    # Repeat queries are served from the search cache instead of re-crawling;
+    # concurrent misses for the same query wait for a single crawl
+    entry, cache_state = search_cache.get_or_compute(query, run_search)
+
+    limit = max(request.args.get('limit', SEARCH_RESULT_LIMIT, type=int), 0)
+    if request.args.get('group') == 'clusters':
+        # One entry per canonical product, with each shop's offer inside. Grouped before
+        # paging, over every stored ranking, so offers below the top page stay in their cluster
+        results = group_by_cluster(ranked_offers(normalize_query(query)) or entry.results, limit)
+    else:
+        results = entry.results[:limit]
+
+    fmt = stream_format()
+    with span('serialize'):
+        response = stream_response(results, fmt) if fmt else jsonify(results)
+    response.headers['X-Cache'] = cache_state
+    if entry.missing:
+        # Let clients know some shops did not answer in time
+        response.headers['X-Partial-Results'] = ', '.join(entry.missing)
+    return response, 200
+
+
+@product_bp.route('/search/cache-stats', methods=['GET'])
+def search_cache_stats():
+    """
+    Hit/miss counters for the search result cache, and requests turned away by rate limits.
+    """
+    stats = search_cache.stats()
+    stats["rate_limited"] = dict(rate_limiter.limited)
+    return jsonify(stats), 200
+
+
+@product_bp.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    """
+    Suggest products for a partially typed query (prefix and typo tolerant).
+    """
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    if not query.strip():
+        return jsonify([]), 200
+
+    product_index.ensure_loaded()
+    suggestions = []
+    for product_id, score in product_index.search(query, limit=limit):
+        product_name, shop_name = product_index.describe(product_id)
+        suggestions.append({
+            "product_id": product_id,
+            "product_name": product_name,
+            "shop_name": shop_name,
+            "score": round(score, 4),
+        })
+    return jsonify(suggestions), 200
@@ -1,20 +1,16 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import get_jwt, decode_token
-from model import SearchHistory, db
-import jwt  # import the JWT package directly for decoding
+from services.auth_cache import bearer_token, token_cache
+from services.db_routing import read_only, stick_to_primary
+from services.pagination import decode_cursor
+from services.search_history import history_buffer, history_page
 
 history_bp = Blueprint('history', __name__)
 
 def get_user_id_from_jwt(token):
-    """Decodes the JWT token and retrieves the user_id."""
-    try:
-        # Decode the JWT token to get the payload
-        decoded_token = jwt.decode(token, options={"verify_signature": False})  # Assuming you don't verify the signature here
-        return decoded_token.get('sub')  # assuming 'sub' is the user ID in the JWT
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.JWTError:
-        return None
+    """Verifies the JWT token (cached per token until it expires) and retrieves the user_id."""
+    claims = token_cache.verify(token)
+    return claims.get('sub') if claims else None
 
 @history_bp.route('/save-history', methods=['POST'])
 def save_history():
@@ -22,33 +18,41 @@ def save_history():
     if not token:
         return jsonify({"message": "Token is missing"}), 400
 
-    token = token.split(' ')[1]  # Remove 'Bearer ' from the token
-    user_id = get_user_id_from_jwt(token)
+    user_id = get_user_id_from_jwt(bearer_token(token))
 
     if not user_id:
         return jsonify({"message": "Invalid or expired token"}), 401
 
     data = request.json
     query = data.get('query')
+    if not query:
+        return jsonify({"message": "Query is required"}), 400
 
-    new_history = SearchHistory(user_id=user_id, query=query)
-    db.session.add(new_history)
-    db.session.commit()
+    # Buffered and written in bulk by the history writer
+    history_buffer.record(user_id, query)
+    stick_to_primary()
 
     return jsonify({"message": "Search history saved"}), 200
 
 
 @history_bp.route('/get-history', methods=['GET'])
+@read_only
 def get_history():
     token = request.headers.get('Authorization')
     if not token:
         return jsonify({"message": "Token is missing"}), 400
 
-    token = token.split(' ')[1]  # Remove 'Bearer ' from the token
-    user_id = get_user_id_from_jwt(token)
+    user_id = get_user_id_from_jwt(bearer_token(token))
 
     if not user_id:
         return jsonify({"message": "Invalid or expired token"}), 401
 
-    history = SearchHistory.query.filter_by(user_id=user_id).order_by(SearchHistory.timestamp.desc()).all()
-    return jsonify([h.to_dict() for h in history]), 200
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor, datetime.fromisoformat, int) if cursor else None
+    except ValueError:
+        return jsonify({"message": "Invalid limit or cursor"}), 400
+
+    history, next_cursor = history_page(user_id, limit, cursor)
+    return jsonify({"history": [h.to_dict() for h in history], "next_cursor": next_cursor}), 200
@@ -1,10 +1,18 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from model import db, User, SearchHistory
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from model import db, User
+from services.db_routing import read_only, stick_to_primary
+from services.pagination import decode_cursor
+from services.auth_cache import issue_token
+from services.passwords import PasswordServiceBusy
+from services.search_history import history_buffer, history_page, top_recent_queries
 
 user_bp = Blueprint('user', __name__)
 
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
 @user_bp.route('/register', methods=['POST'])
 def register():
     """
@@ -22,11 +30,12 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({"message": "Email already registered"}), 400
 
-    # Hash the password
-    hashed_password = generate_password_hash(password)
-
-    # Create a new user
-    new_user = User(username=username, email=email, password_hash=hashed_password)
+    # Create a new user and hash the password
+    new_user = User(username=username, email=email)
+    try:
+        new_user.set_password(password)
+    except PasswordServiceBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503
     db.session.add(new_user)
     db.session.commit()
 
@@ -47,11 +56,15 @@ def login():
 
     # Find the user by email
     user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
-        return jsonify({"message": "Invalid credentials"}), 401
-
-    # Generate JWT token
-    access_token = create_access_token(identity=user.id)
+    try:
+        if not user or not user.check_password(password):
+            return jsonify({"message": "Invalid credentials"}), 401
+    except PasswordServiceBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503
+
+    # Generate JWT token; the commit also persists an upgraded password hash
+    access_token = issue_token(user.id)
+    db.session.commit()
     return jsonify({"access_token": access_token}), 200
 
 
@@ -95,24 +108,47 @@ def save_search_history():
     if not search_query:
         return jsonify({"message": "Search query is required"}), 400
 
-    # Save the search query to the database
-    new_search = SearchHistory(user_id=user_id, search_query=search_query)
-    db.session.add(new_search)
-    db.session.commit()
+    # Buffered and written in bulk by the history writer
+    history_buffer.record(user_id, search_query)
+    stick_to_primary()
 
     return jsonify({"message": "Search history saved successfully"}), 200
 
 
 @user_bp.route('/get-search-history', methods=['GET'])
+@read_only
 @jwt_required()
 def get_search_history():
     """
-    Retrieve a user's search history.
+    Retrieve one page of a user's search history, newest first.
+    Pass the returned next_cursor as ?cursor= to fetch the following page.
     """
     user_id = get_jwt_identity()
 
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_HISTORY_PAGE_SIZE)), MAX_HISTORY_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor, datetime.fromisoformat, int) if cursor else None
+    except ValueError:
+        return jsonify({"message": "Invalid limit or cursor"}), 400
+
     # Fetch the user's search history
-    search_history = SearchHistory.query.filter_by(user_id=user_id).all()
-    history_list = [{"id": sh.id, "search_query": sh.search_query, "search_date": sh.search_date} for sh in search_history]
+    search_history, next_cursor = history_page(user_id, limit, cursor)
+    history_list = [sh.to_dict() for sh in search_history]
+
+    return jsonify({"history": history_list, "next_cursor": next_cursor}), 200
+
+
+@user_bp.route('/search-history/top', methods=['GET'])
+@read_only
+@jwt_required()
+def get_top_searches():
+    """
+    Retrieve a user's most frequent recent queries (from the precomputed summary).
+    """
+    user_id = get_jwt_identity()
+    days = request.args.get('days', 30, type=int)
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_HISTORY_PAGE_SIZE))
 
-    return jsonify(history_list), 200
\ No newline at end of file
+    top_queries = top_recent_queries(user_id, days=days, limit=limit)
+    return jsonify([summary.to_dict() for summary in top_queries]), 200